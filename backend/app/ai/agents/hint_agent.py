@@ -1,13 +1,15 @@
 """
 Hint Generator Agent for progressive exercise hints
 """
-from typing import Dict, List
+from typing import Dict, List, Optional
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
+import asyncio
 
 from app.ai.chat_service import ChatService
 from app.ai.prompts.system_prompts import get_system_prompt
 from app.api.v1.user_context import get_user_context_for_ai
+from app.services.exercise_cache import get_exercise_cached
 
 
 class HintAgent:
@@ -37,7 +39,7 @@ Tailor your hints to match the user's experience level and learning style. If th
         exercise_id: str,
         hint_level: int,
         user_code: str = "",
-        previous_attempts: int = 0,
+        previous_attempts: Optional[int] = None,
     ) -> Dict:
         """
         Generate a hint for the current exercise
@@ -47,16 +49,21 @@ Tailor your hints to match the user's experience level and learning style. If th
             exercise_id: Current exercise ID
             hint_level: Which hint number (1-4)
             user_code: Student's current code
-            previous_attempts: Number of failed attempts
+            previous_attempts: Number of failed attempts, counted here when not given
         """
         # Get exercise details (exercises use exercise_id string, not _id ObjectId)
-        exercise = await self.db.exercises.find_one({"exercise_id": exercise_id})
+        # alongside the personalised prompt and, if needed, the attempt count
+        exercise, system_prompt, attempt_count = await asyncio.gather(
+            get_exercise_cached(self.db.exercises, exercise_id),
+            self._get_enhanced_system_prompt(user_id),
+            self._count_attempts(user_id, exercise_id, previous_attempts),
+        )
         if not exercise:
             raise ValueError("Exercise not found")
 
         # Build hint request based on level
         hint_request = self._build_hint_request(
-            exercise, hint_level, user_code, previous_attempts
+            exercise, hint_level, user_code, attempt_count
         )
 
         # Get or create session
@@ -73,11 +80,10 @@ Tailor your hints to match the user's experience level and learning style. If th
             },
             "user_code": user_code,
             "hint_level": hint_level,
-            "previous_attempts": previous_attempts,
+            "previous_attempts": attempt_count,
         }
 
         # Get hint from AI with enhanced prompt
-        system_prompt = await self._get_enhanced_system_prompt(user_id)
         response = await self.chat_service.send_message(
             user_id=user_id,
             session_id=session_id,
@@ -95,6 +101,16 @@ Tailor your hints to match the user's experience level and learning style. If th
             "exercise_id": exercise_id,
         }
 
+    async def _count_attempts(
+        self, user_id: str, exercise_id: str, known: Optional[int] = None
+    ) -> int:
+        """Count the user's submissions for an exercise unless the caller already knows"""
+        if known is not None:
+            return known
+        return await self.db.exercise_attempts.count_documents(
+            {"user_id": user_id, "exercise_id": exercise_id}
+        )
+
     def _build_hint_request(
         self,
         exercise: Dict,
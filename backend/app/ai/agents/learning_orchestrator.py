@@ -8,8 +8,9 @@ from bson import ObjectId
 
 from app.ai.chat_service import ChatService
 from app.ai.tool_registry import ToolRegistry
-from app.ai.prompts.system_prompts import get_system_prompt
+from app.ai.prompts.system_prompts import get_system_prompt, get_system_prompt_block
 from app.api.v1.user_context import get_user_context_for_ai
+from app.services.exercise_cache import get_exercise_cached
 
 
 class LearningOrchestrator:
@@ -73,18 +74,15 @@ class LearningOrchestrator:
         print(f"🎓 Starting learning session for node: {node['title']}")
 
         # Send message with tools enabled
-        response = await self.chat_service.send_message(
+        return await self._send_with_tools(
+            tool_registry,
             user_id=user_id,
             session_id=session_id,
             message=initial_message,
             system_prompt=system_prompt,
-            context_data={"node": node},
-            tools=tool_registry.get_tool_definitions(),
-            tool_executor=tool_registry.execute_tool
+            context_data={"node": node}
         )
 
-        return response
-
     async def handle_exercise_submission(
         self,
         user_id: str,
@@ -105,7 +103,7 @@ class LearningOrchestrator:
             Dict with AI response and next action
         """
         # Get exercise details
-        exercise = await self.db.exercises.find_one({"exercise_id": exercise_id})
+        exercise = await get_exercise_cached(self.db.exercises, exercise_id)
         if not exercise:
             return {
                 "error": "Exercise not found",
@@ -147,18 +145,15 @@ Analyze their submission:
         print(f"📝 Exercise submission: {exercise['title']} - Score: {test_results['score']}%")
 
         # AI analyzes and responds with tools
-        response = await self.chat_service.send_message(
+        return await self._send_with_tools(
+            tool_registry,
             user_id=user_id,
             session_id=session_id,
             message=message,
             system_prompt=system_prompt,
-            context_data=context_data,
-            tools=tool_registry.get_tool_definitions(),
-            tool_executor=tool_registry.execute_tool
+            context_data=context_data
         )
 
-        return response
-
     async def continue_learning(
         self,
         user_id: str,
@@ -180,24 +175,35 @@ Analyze their submission:
         tool_registry = ToolRegistry(self.db, user_id)
 
         # Get session to understand context
-        session = await self.db.chat_sessions.find_one({"_id": ObjectId(session_id)})
+        session_oid = ObjectId(session_id)
+        session = await self.db.chat_sessions.find_one({"_id": session_oid})
         if not session:
             return {"error": "Session not found"}
 
         # Build appropriate system prompt based on context
-        system_prompt = get_system_prompt("learning_orchestrator")
+        system_prompt = get_system_prompt_block("learning_orchestrator")
 
         # Send message with tools
-        response = await self.chat_service.send_message(
+        return await self._send_with_tools(
+            tool_registry,
             user_id=user_id,
-            session_id=session_id,
+            session_id=session_oid,
             message=message,
-            system_prompt=system_prompt,
-            tools=tool_registry.get_tool_definitions(),
-            tool_executor=tool_registry.execute_tool
+            system_prompt=system_prompt
         )
 
-        return response
+    async def _send_with_tools(self, tool_registry: ToolRegistry, **kwargs) -> Dict:
+        """Send a message with the registry's tools enabled and flush its queued writes"""
+        try:
+            return await self.chat_service.send_message(
+                tools=tool_registry.get_tool_definitions(),
+                tool_executor=tool_registry.execute_tool,
+                **kwargs
+            )
+        finally:
+            # Progress updates queued by tools are written once per turn, even
+            # if the turn failed after the tool ran; flush logs its own errors
+            await tool_registry.flush()
 
     def _build_orchestrator_prompt(
         self,
@@ -1,7 +1,8 @@
 """
 AI Tutor Agent for personalized learning assistance
 """
-from typing import Dict, Optional
+from typing import AsyncIterator, Dict, Optional
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from app.ai.chat_service import ChatService
@@ -49,14 +50,14 @@ Use this context to personalize your responses, examples, and teaching approach.
             context_id: ID of exercise or node if applicable
             context_data: Additional context (exercise details, code, etc.)
         """
-        # Get or create chat session
-        session_id = await self.chat_service.get_or_create_session(
-            user_id=user_id, context_type=context_type, context_id=context_id
+        # Resolve the chat session and the personalised prompt concurrently
+        session_id, system_prompt = await asyncio.gather(
+            self.chat_service.get_or_create_session(
+                user_id=user_id, context_type=context_type, context_id=context_id
+            ),
+            self._get_enhanced_system_prompt(user_id, "tutor"),
         )
 
-        # Get enhanced system prompt with user context
-        system_prompt = await self._get_enhanced_system_prompt(user_id, "tutor")
-
         # Send message and get response
         response = await self.chat_service.send_message(
             user_id=user_id,
@@ -68,6 +69,35 @@ Use this context to personalize your responses, examples, and teaching approach.
 
         return response
 
+    async def ask_question_stream(
+        self,
+        user_id: str,
+        question: str,
+        context_type: str = "general",
+        context_id: Optional[str] = None,
+        context_data: Optional[Dict] = None,
+    ) -> AsyncIterator[Dict]:
+        """
+        Streaming variant of ask_question
+
+        Yields the chunk events produced by ChatService.send_message_stream.
+        """
+        session_id, system_prompt = await asyncio.gather(
+            self.chat_service.get_or_create_session(
+                user_id=user_id, context_type=context_type, context_id=context_id
+            ),
+            self._get_enhanced_system_prompt(user_id, "tutor"),
+        )
+
+        async for event in self.chat_service.send_message_stream(
+            user_id=user_id,
+            session_id=session_id,
+            message=question,
+            system_prompt=system_prompt,
+            context_data=context_data,
+        ):
+            yield event
+
     async def explain_concept(
         self, user_id: str, concept: str, difficulty_level: str = "beginner"
     ) -> Dict:
@@ -81,12 +111,13 @@ Use this context to personalize your responses, examples, and teaching approach.
         """
         prompt = f"Can you explain {concept} to me? I'm at a {difficulty_level} level."
 
-        session_id = await self.chat_service.get_or_create_session(
-            user_id=user_id, context_type="concept", context_id=concept
+        session_id, system_prompt = await asyncio.gather(
+            self.chat_service.get_or_create_session(
+                user_id=user_id, context_type="concept", context_id=concept
+            ),
+            self._get_enhanced_system_prompt(user_id, "tutor"),
         )
 
-        system_prompt = await self._get_enhanced_system_prompt(user_id, "tutor")
-
         response = await self.chat_service.send_message(
             user_id=user_id,
             session_id=session_id,
@@ -112,12 +143,13 @@ Use this context to personalize your responses, examples, and teaching approach.
 
         context_data = {"user_code": code, "error": error_message}
 
-        session_id = await self.chat_service.get_or_create_session(
-            user_id=user_id, context_type="exercise", context_id=exercise_id
+        session_id, system_prompt = await asyncio.gather(
+            self.chat_service.get_or_create_session(
+                user_id=user_id, context_type="exercise", context_id=exercise_id
+            ),
+            self._get_enhanced_system_prompt(user_id, "tutor"),
         )
 
-        system_prompt = await self._get_enhanced_system_prompt(user_id, "tutor")
-
         response = await self.chat_service.send_message(
             user_id=user_id,
             session_id=session_id,
@@ -138,12 +170,13 @@ Use this context to personalize your responses, examples, and teaching approach.
         """
         prompt = f"I'm feeling a bit stuck on {context}. Any encouragement?" if context else "I'm feeling a bit stuck. Any encouragement?"
 
-        session_id = await self.chat_service.get_or_create_session(
-            user_id=user_id, context_type="encouragement"
+        session_id, system_prompt = await asyncio.gather(
+            self.chat_service.get_or_create_session(
+                user_id=user_id, context_type="encouragement"
+            ),
+            self._get_enhanced_system_prompt(user_id, "tutor"),
         )
 
-        system_prompt = await self._get_enhanced_system_prompt(user_id, "tutor")
-
         response = await self.chat_service.send_message(
             user_id=user_id,
             session_id=session_id,
@@ -1,75 +1,230 @@
 """
 Chat service for managing AI conversations with Claude
 """
-from typing import List, Dict, Optional, Callable
-from anthropic import AsyncAnthropic
+from typing import AsyncIterator, List, Dict, Mapping, Optional, Callable, Set, Union
+from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
 from bson import ObjectId
-from datetime import datetime
-import json
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+from datetime import datetime, timezone
+from functools import lru_cache
+import asyncio
+import httpx
+import weakref
+import logging
+import orjson
 
 from app.config import get_settings
+from app.services.chat_session_cache import (
+    cache_chat_session,
+    get_cached_chat_session,
+    invalidate_chat_sessions
+)
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# One client per process so the connection pool and TLS sessions are reused;
+# the SDK retries 429/5xx/connection errors with exponential backoff
+_anthropic_client = AsyncAnthropic(
+    api_key=settings.ANTHROPIC_API_KEY,
+    max_retries=2,
+    timeout=httpx.Timeout(60.0, connect=5.0),
+    http_client=DefaultAsyncHttpxClient(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+    ),
+)
+
+# Caps in-flight Claude requests so bursts queue here instead of tripping rate limits
+_llm_semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+
+# Beta header enabling prompt caching on the Messages API
+PROMPT_CACHING_BETA = "prompt-caching-2024-07-31"
+
+# Mark a conversation checkpoint every N messages so the growing prefix is cached
+CACHE_CHECKPOINT_INTERVAL = 10
+
+# Minimum number of past messages replayed to Claude on each turn
+HISTORY_WINDOW = 20
+
+# Only the fields Claude needs when replaying a conversation
+CONVERSATION_PROJECTION = {"_id": 0, "role": 1, "content": 1}
+
+# Conversation replays read two fields per message; skip full dict decoding
+RAW_BSON_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+# Session updated_at touches arriving within this window share one update_many
+SESSION_TOUCH_WINDOW = 0.01
+
+
+def _format_exercise(context_data: Dict) -> str:
+    ex = context_data["exercise"]
+    lines = [
+        f"Exercise: {ex.get('title', 'N/A')}",
+        f"Description: {ex.get('description', 'N/A')}",
+    ]
+    if "difficulty" in ex:
+        lines.append(f"Difficulty: {ex['difficulty']}")
+    return "\n".join(lines)
+
+
+def _format_node(context_data: Dict) -> str:
+    return f"Topic: {context_data['node'].get('title', 'N/A')}"
+
+
+def _format_user_code(context_data: Dict) -> str:
+    return f"\nUser's current code:\n```\n{context_data['user_code']}\n```"
+
+
+def _format_test_results(context_data: Dict) -> str:
+    results = context_data["test_results"]
+    return f"\nTest Results: {results.get('passed', 0)}/{results.get('total', 0)} passed"
+
+
+def _format_progress(context_data: Dict) -> str:
+    prog = context_data["progress"]
+    return f"User Progress: {prog.get('nodes_completed', 0)} nodes completed"
+
+
+# Context sections in the order they appear in the prompt
+_CONTEXT_FORMATTERS = (
+    ("exercise", _format_exercise),
+    ("node", _format_node),
+    ("user_code", _format_user_code),
+    ("test_results", _format_test_results),
+    ("progress", _format_progress),
+)
+
+
+@lru_cache(maxsize=64)
+def _formatters_for(keys: frozenset) -> tuple:
+    """Formatters that apply to a given context shape, resolved once per shape"""
+    return tuple(fn for key, fn in _CONTEXT_FORMATTERS if key in keys)
+
+
+# Per-key locks so concurrent first requests in this process don't create
+# duplicate sessions; an entry lives only while some request holds its lock
+_session_locks = weakref.WeakValueDictionary()
+
+# Turn writes still in flight, held so they aren't garbage collected mid-write
+_pending_writes: Set[asyncio.Task] = set()
+
+
+async def close_anthropic_client():
+    """Close the shared Anthropic client"""
+    await _anthropic_client.close()
+    print("✅ Closed Anthropic client")
+
+
+async def drain_pending_writes():
+    """Wait for background chat writes to finish before shutdown"""
+    if _pending_writes:
+        await asyncio.gather(*_pending_writes, return_exceptions=True)
+        print("✅ Flushed pending chat writes")
+    if ChatService._flush_task:
+        await ChatService._flush_task
 
 
 class ChatService:
     """Service for handling AI chat interactions"""
 
+    # Session touches waiting for the next update_many. Class-level state, so
+    # it is per process: each uvicorn worker batches only its own touches
+    _pending_session_touches: Set[ObjectId] = set()
+    _flush_task: Optional[asyncio.Task] = None
+
     def __init__(self, db: AsyncIOMotorDatabase):
         self.db = db
-        self.client = AsyncAnthropic(api_key=settings.ANTHROPIC_API_KEY)
+        self.client = _anthropic_client
         self.model = "claude-3-haiku-20240307"
 
     async def get_or_create_session(
         self, user_id: str, context_type: str, context_id: Optional[str] = None
-    ) -> str:
-        """Get existing session or create new one"""
-        # Try to find active session
-        query = {
-            "user_id": user_id,
-            "context_type": context_type,
-            "is_active": True,
-        }
-        if context_id:
-            query["context_id"] = context_id
-
-        session = await self.db.chat_sessions.find_one(query)
-
-        if session:
-            return str(session["_id"])
-
-        # Create new session
-        new_session = {
-            "user_id": user_id,
-            "context_type": context_type,
-            "context_id": context_id,
-            "is_active": True,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow(),
-        }
-        result = await self.db.chat_sessions.insert_one(new_session)
-        return str(result.inserted_id)
+    ) -> ObjectId:
+        """Get existing session or create new one, returning its ObjectId"""
+        session_id = await get_cached_chat_session(user_id, context_type, context_id)
+        if session_id:
+            return session_id
+
+        key = (user_id, context_type, context_id)
+        lock = _session_locks.get(key)
+        if lock is None:
+            lock = _session_locks[key] = asyncio.Lock()
+
+        async with lock:
+            # Another request may have resolved the session while we waited
+            session_id = await get_cached_chat_session(user_id, context_type, context_id)
+            if session_id:
+                return session_id
+
+            # Try to find active session
+            query = {
+                "user_id": user_id,
+                "context_type": context_type,
+                "is_active": True,
+            }
+            if context_id:
+                query["context_id"] = context_id
+
+            session = await self.db.chat_sessions.find_one(query, {"_id": 1})
+
+            if session:
+                session_id = session["_id"]
+            else:
+                # Create new session
+                now = datetime.now(timezone.utc)
+                new_session = {
+                    "user_id": user_id,
+                    "context_type": context_type,
+                    "context_id": context_id,
+                    "is_active": True,
+                    "created_at": now,
+                    "updated_at": now,
+                }
+                result = await self.db.chat_sessions.insert_one(new_session)
+                session_id = result.inserted_id
+
+            await cache_chat_session(user_id, context_type, context_id, session_id)
+            return session_id
 
     async def get_session_history(
-        self, session_id: str, limit: int = 50
+        self, session_id: ObjectId, limit: int = 50, projection: Optional[Dict] = None
     ) -> List[Dict]:
-        """Get chat history for a session"""
-        messages = (
-            await self.db.chat_messages.find({"session_id": session_id})
-            .sort("created_at", -1)
-            .limit(limit)
-            .to_list(length=limit)
-        )
-        # Reverse to get chronological order
-        return list(reversed(messages))
+        """Get the most recent messages of a session in chronological order"""
+        pipeline = self._history_pipeline(session_id, limit)
+        if projection:
+            pipeline.append({"$project": projection})
+
+        return await self.db.chat_messages.aggregate(pipeline).to_list(length=limit)
+
+    async def iter_session_history(
+        self, session_id: ObjectId, limit: int = 50, projection: Optional[Dict] = None
+    ) -> AsyncIterator[Dict]:
+        """Like get_session_history, but yield messages as the cursor returns them"""
+        pipeline = self._history_pipeline(session_id, limit)
+        if projection:
+            pipeline.append({"$project": projection})
+
+        async for message in self.db.chat_messages.aggregate(pipeline):
+            yield message
+
+    def _history_pipeline(self, session_id: ObjectId, limit: int) -> List[Dict]:
+        """Pipeline selecting the last `limit` messages, oldest first"""
+        return [
+            {"$match": {"session_id": session_id}},
+            {"$sort": {"created_at": -1}},
+            {"$limit": limit},
+            {"$sort": {"created_at": 1}},
+        ]
 
     async def send_message(
         self,
         user_id: str,
-        session_id: str,
+        session_id: ObjectId,
         message: str,
-        system_prompt: str,
+        system_prompt: Union[str, Mapping],
         context_data: Optional[Dict] = None,
         tools: Optional[List[Dict]] = None,
         tool_executor: Optional[Callable] = None,
@@ -79,9 +234,9 @@ class ChatService:
 
         Args:
             user_id: User ID
-            session_id: Chat session ID
+            session_id: Chat session ObjectId, as returned by get_or_create_session
             message: User message
-            system_prompt: System prompt for Claude
+            system_prompt: System prompt text, or a pre-built block from get_system_prompt_block
             context_data: Additional context data
             tools: List of tool definitions for Claude to use
             tool_executor: Async function to execute tools: async (tool_name, tool_input) -> str
@@ -89,28 +244,12 @@ class ChatService:
         Returns:
             Dict with message, session_id, timestamp, and any tool-generated IDs
         """
-        # Save user message
-        user_msg = {
-            "session_id": session_id,
-            "role": "user",
-            "content": message,
-            "created_at": datetime.utcnow(),
-        }
-        await self.db.chat_messages.insert_one(user_msg)
-
-        # Get conversation history
-        history = await self.get_session_history(session_id, limit=20)
+        # User message is persisted together with the reply once Claude responds
+        user_msg = self._build_user_message(session_id, message)
+        messages = await self._build_conversation(session_id, message)
 
-        # Build messages for Claude
-        messages = []
-        for msg in history:
-            messages.append({"role": msg["role"], "content": msg["content"]})
-
-        # Add context to system prompt if provided
-        enhanced_system = system_prompt
-        if context_data:
-            context_str = self._format_context(context_data)
-            enhanced_system = f"{system_prompt}\n\n{context_str}"
+        # Static prompt is cached; volatile context goes in a separate uncached block
+        system_blocks = self._build_system_blocks(system_prompt, context_data)
 
         # Track tool results for return
         tool_results = {
@@ -131,15 +270,17 @@ class ChatService:
             api_params = {
                 "model": self.model,
                 "max_tokens": 4096,
-                "system": enhanced_system,
+                "system": system_blocks,
                 "messages": messages,
+                "extra_headers": {"anthropic-beta": PROMPT_CACHING_BETA},
             }
 
             # Add tools if provided
             if tools:
                 api_params["tools"] = tools
 
-            response = await self.client.messages.create(**api_params)
+            async with _llm_semaphore:
+                response = await self.client.messages.create(**api_params)
 
             # Handle different stop reasons
             if response.stop_reason == "end_turn":
@@ -165,11 +306,11 @@ class ChatService:
                         tool_input = block.input
 
                         print(f"🔧 AI invoking tool: {tool_name}")
-                        print(f"   Input: {json.dumps(tool_input, indent=2)}")
+                        print(f"   Input: {orjson.dumps(tool_input, option=orjson.OPT_INDENT_2).decode()}")
 
                         try:
                             result = await tool_executor(tool_name, tool_input)
-                            result_dict = json.loads(result) if isinstance(result, str) else result
+                            result_dict = orjson.loads(result) if isinstance(result, str) else result
 
                             # Track important IDs from tool execution
                             if "content_id" in result_dict:
@@ -194,7 +335,7 @@ class ChatService:
                             tool_use_results.append({
                                 "type": "tool_result",
                                 "tool_use_id": block.id,
-                                "content": json.dumps({"error": str(e)}),
+                                "content": orjson.dumps({"error": str(e)}).decode(),
                                 "is_error": True
                             })
 
@@ -221,26 +362,197 @@ class ChatService:
         if iteration >= max_iterations and not assistant_content:
             assistant_content = "I've completed the setup for your learning session. Let's begin!"
 
-        # Save assistant response
-        assistant_msg = {
-            "session_id": session_id,
-            "role": "assistant",
-            "content": assistant_content,
-            "created_at": datetime.utcnow(),
+        responded_at = self._schedule_persist_turn(session_id, user_msg, assistant_content)
+
+        return {
+            "message": assistant_content,
+            "session_id": str(session_id),
+            "timestamp": responded_at.isoformat(),
+            **tool_results  # Include content_id, exercise_id, actions
         }
-        await self.db.chat_messages.insert_one(assistant_msg)
 
-        # Update session timestamp
-        await self.db.chat_sessions.update_one(
-            {"_id": ObjectId(session_id)}, {"$set": {"updated_at": datetime.utcnow()}}
-        )
+    async def send_message_stream(
+        self,
+        user_id: str,
+        session_id: ObjectId,
+        message: str,
+        system_prompt: Union[str, Mapping],
+        context_data: Optional[Dict] = None,
+    ) -> AsyncIterator[Dict]:
+        """
+        Send message and stream the AI response as it is generated
+
+        Tool calling is not supported on this path; use send_message for agents
+        that need tools.
 
+        Yields:
+            {"type": "text", "text": ...} for each chunk, then a final
+            {"type": "done", "session_id": ..., "timestamp": ...} once saved
+        """
+        user_msg = self._build_user_message(session_id, message)
+        messages = await self._build_conversation(session_id, message)
+        system_blocks = self._build_system_blocks(system_prompt, context_data)
+
+        async with _llm_semaphore, self.client.messages.stream(
+            model=self.model,
+            max_tokens=4096,
+            system=system_blocks,
+            messages=messages,
+            extra_headers={"anthropic-beta": PROMPT_CACHING_BETA},
+        ) as stream:
+            async for text in stream.text_stream:
+                yield {"type": "text", "text": text}
+            response = await stream.get_final_message()
+
+        assistant_content = self._extract_text_content(response.content)
+        if response.stop_reason == "max_tokens":
+            assistant_content += "\n\n[Response truncated due to length]"
+
+        responded_at = self._schedule_persist_turn(session_id, user_msg, assistant_content)
+        yield {
+            "type": "done",
+            "session_id": str(session_id),
+            "timestamp": responded_at.isoformat(),
+        }
+
+    def _build_user_message(self, session_id: ObjectId, message: str) -> Dict:
+        """Build the user message document, timestamped when it was received"""
         return {
-            "message": assistant_content,
             "session_id": session_id,
-            "timestamp": datetime.utcnow().isoformat(),
-            **tool_results  # Include content_id, exercise_id, actions
+            "role": "user",
+            "content": message,
+            "created_at": datetime.now(timezone.utc),
+        }
+
+    async def _build_conversation(self, session_id: ObjectId, message: str) -> List[Dict]:
+        """
+        Build the Claude message list from recent history plus the new message
+
+        The replayed window starts on a multiple of CACHE_CHECKPOINT_INTERVAL
+        rather than sliding one turn at a time, so the cached prefix stays
+        byte-identical across turns until the window advances a full interval.
+        """
+        limit = HISTORY_WINDOW + CACHE_CHECKPOINT_INTERVAL - 1
+        pipeline = self._history_pipeline(session_id, limit)
+        pipeline.append({"$project": CONVERSATION_PROJECTION})
+
+        # Raw documents are only decoded for the two projected fields read here
+        total, history = await asyncio.gather(
+            self.db.chat_messages.count_documents({"session_id": session_id}),
+            self.db.chat_messages.with_options(codec_options=RAW_BSON_OPTIONS)
+            .aggregate(pipeline)
+            .to_list(length=limit),
+        )
+
+        # Drop the oldest fetched messages that precede the aligned window start
+        window_start = max(0, total - HISTORY_WINDOW)
+        window_start -= window_start % CACHE_CHECKPOINT_INTERVAL
+        skip = min(max(0, window_start - (total - len(history))), len(history))
+        history = history[skip:]
+
+        messages = [{"role": msg["role"], "content": msg["content"]} for msg in history]
+        messages.append({"role": "user", "content": message})
+        self._apply_cache_checkpoints(messages)
+        return messages
+
+    def _schedule_persist_turn(
+        self, session_id: ObjectId, user_msg: Dict, assistant_content: str
+    ) -> datetime:
+        """Save the turn in the background so the reply isn't held on the write"""
+        responded_at = datetime.now(timezone.utc)
+        assistant_msg = {
+            "session_id": user_msg["session_id"],
+            "role": "assistant",
+            "content": assistant_content,
+            "created_at": responded_at,
         }
+        task = asyncio.create_task(self._persist_turn(session_id, user_msg, assistant_msg))
+        _pending_writes.add(task)
+        task.add_done_callback(_pending_writes.discard)
+        return responded_at
+
+    async def _persist_turn(self, session_id: ObjectId, user_msg: Dict, assistant_msg: Dict):
+        """Save both turns in one insert and queue the session touch"""
+        try:
+            await self.db.chat_messages.insert_many([user_msg, assistant_msg])
+        except Exception:
+            logger.exception("❌ Failed to save chat turn for session %s", session_id)
+            return
+        self._touch_session(session_id)
+
+    def _touch_session(self, session_id: ObjectId):
+        """Queue an updated_at bump, flushed with other touches in the same window"""
+        ChatService._pending_session_touches.add(session_id)
+        if ChatService._flush_task is None:
+            ChatService._flush_task = asyncio.create_task(self._flush_session_touches())
+
+    async def _flush_session_touches(self):
+        """Apply all queued session touches with a single update_many"""
+        try:
+            await asyncio.sleep(SESSION_TOUCH_WINDOW)
+        finally:
+            session_ids = list(ChatService._pending_session_touches)
+            ChatService._pending_session_touches.clear()
+            ChatService._flush_task = None
+
+        try:
+            await self.db.chat_sessions.update_many(
+                {"_id": {"$in": session_ids}},
+                {"$set": {"updated_at": datetime.now(timezone.utc)}},
+            )
+        except Exception:
+            logger.exception("❌ Failed to touch %d chat sessions", len(session_ids))
+
+    def _build_system_blocks(
+        self, system_prompt: Union[str, Mapping], context_data: Optional[Dict] = None
+    ) -> List[Dict]:
+        """Build structured system blocks with the static prompt marked for caching"""
+        if isinstance(system_prompt, Mapping):
+            # Pre-built block from get_system_prompt_block
+            blocks = [system_prompt]
+        else:
+            blocks = [
+                {
+                    "type": "text",
+                    "text": system_prompt,
+                    "cache_control": {"type": "ephemeral"},
+                }
+            ]
+        if context_data:
+            blocks.append({"type": "text", "text": self._format_context(context_data)})
+        return blocks
+
+    def _apply_cache_checkpoints(self, messages: List[Dict]):
+        """
+        Mark cache breakpoints on the conversation history in place
+
+        The API allows four breakpoints per request. One is used by the system
+        prompt; the rest go on the oldest and most recent periodic checkpoints
+        and on the last user turn.
+        """
+        if not messages:
+            return
+
+        last = len(messages) - 1
+        checkpoints = list(
+            range(CACHE_CHECKPOINT_INTERVAL - 1, last, CACHE_CHECKPOINT_INTERVAL)
+        )
+        marked = {last}
+        if checkpoints:
+            marked.update((checkpoints[0], checkpoints[-1]))
+
+        for i in marked:
+            msg = messages[i]
+            messages[i] = {
+                "role": msg["role"],
+                "content": [
+                    {
+                        "type": "text",
+                        "text": msg["content"],
+                        "cache_control": {"type": "ephemeral"},
+                    }
+                ],
+            }
 
     def _extract_text_content(self, content_blocks) -> str:
         """Extract text content from Claude response blocks"""
@@ -254,34 +566,22 @@ class ChatService:
 
     def _format_context(self, context_data: Dict) -> str:
         """Format context data for system prompt"""
-        context_parts = ["CURRENT CONTEXT:"]
-
-        if "exercise" in context_data:
-            ex = context_data["exercise"]
-            context_parts.append(f"Exercise: {ex.get('title', 'N/A')}")
-            context_parts.append(f"Description: {ex.get('description', 'N/A')}")
-            if "difficulty" in ex:
-                context_parts.append(f"Difficulty: {ex['difficulty']}")
-
-        if "node" in context_data:
-            node = context_data["node"]
-            context_parts.append(f"Topic: {node.get('title', 'N/A')}")
-
-        if "user_code" in context_data:
-            context_parts.append(f"\nUser's current code:\n```\n{context_data['user_code']}\n```")
-
-        if "test_results" in context_data:
-            results = context_data["test_results"]
-            context_parts.append(f"\nTest Results: {results.get('passed', 0)}/{results.get('total', 0)} passed")
-
-        if "progress" in context_data:
-            prog = context_data["progress"]
-            context_parts.append(f"User Progress: {prog.get('nodes_completed', 0)} nodes completed")
-
-        return "\n".join(context_parts)
+        formatters = _formatters_for(frozenset(context_data))
+        return "\n".join(["CURRENT CONTEXT:", *(fn(context_data) for fn in formatters)])
 
     async def close_session(self, session_id: str):
         """Mark session as inactive"""
-        await self.db.chat_sessions.update_one(
-            {"_id": ObjectId(session_id)}, {"$set": {"is_active": False}}
+        session_oid = ObjectId(session_id)
+        session = await self.db.chat_sessions.find_one_and_update(
+            {"_id": session_oid},
+            {"$set": {"is_active": False}},
+            projection={"user_id": 1, "context_type": 1, "context_id": 1},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if not session:
+            return
+
+        # Drop cached lookups that may resolve to the closed session, in every worker
+        await invalidate_chat_sessions(
+            session["user_id"], session["context_type"], session.get("context_id")
         )
@@ -0,0 +1,41 @@
+"""
+Shared AI agent instances and their FastAPI dependencies
+
+Agents hold nothing per request beyond their db handle, so one of each is
+built at startup and injected instead of being constructed per request.
+"""
+from fastapi import FastAPI, Request
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.ai.chat_service import ChatService
+from app.ai.agents.tutor_agent import TutorAgent
+from app.ai.agents.hint_agent import HintAgent
+from app.ai.agents.learning_orchestrator import LearningOrchestrator
+
+
+def init_agents(app: FastAPI, db: AsyncIOMotorDatabase):
+    """Build the shared agents and attach them to app.state"""
+    app.state.chat_service = ChatService(db)
+    app.state.tutor = TutorAgent(db)
+    app.state.hint_agent = HintAgent(db)
+    app.state.orchestrator = LearningOrchestrator(db)
+
+
+def get_chat_service(request: Request) -> ChatService:
+    """Dependency for the shared chat service"""
+    return request.app.state.chat_service
+
+
+def get_tutor(request: Request) -> TutorAgent:
+    """Dependency for the shared tutor agent"""
+    return request.app.state.tutor
+
+
+def get_hint_agent(request: Request) -> HintAgent:
+    """Dependency for the shared hint agent"""
+    return request.app.state.hint_agent
+
+
+def get_orchestrator(request: Request) -> LearningOrchestrator:
+    """Dependency for the shared learning orchestrator"""
+    return request.app.state.orchestrator
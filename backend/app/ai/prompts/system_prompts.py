@@ -1,6 +1,9 @@
 """
 System prompts for different AI agents
 """
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Mapping
 
 TUTOR_PROMPT = """You are an expert DevOps tutor helping students learn Python, Bash, Terraform, and Pulumi.
 
@@ -196,14 +199,34 @@ You:
 Remember: You're not a chatbot pointing to resources - you're an active teacher creating a personalized learning experience in real-time."""
 
 
+_PROMPTS = MappingProxyType({
+    "tutor": TUTOR_PROMPT,
+    "hint": HINT_GENERATOR_PROMPT,
+    "feedback": FEEDBACK_GENERATOR_PROMPT,
+    "progress": PROGRESS_ANALYZER_PROMPT,
+    "onboarding": ONBOARDING_PROMPT,
+    "learning_orchestrator": LEARNING_ORCHESTRATOR_PROMPT,
+})
+
+
+@lru_cache(maxsize=None)
 def get_system_prompt(agent_type: str) -> str:
     """Get system prompt for specified agent type"""
-    prompts = {
-        "tutor": TUTOR_PROMPT,
-        "hint": HINT_GENERATOR_PROMPT,
-        "feedback": FEEDBACK_GENERATOR_PROMPT,
-        "progress": PROGRESS_ANALYZER_PROMPT,
-        "onboarding": ONBOARDING_PROMPT,
-        "learning_orchestrator": LEARNING_ORCHESTRATOR_PROMPT,
-    }
-    return prompts.get(agent_type, TUTOR_PROMPT)
+    return _PROMPTS.get(agent_type, TUTOR_PROMPT)
+
+
+# Ready-to-send Anthropic text blocks, shared and read-only
+PROMPT_BLOCKS = MappingProxyType({
+    agent_type: MappingProxyType({
+        "type": "text",
+        "text": prompt,
+        # Plain dict: the SDK hands cache_control to the JSON encoder as-is
+        "cache_control": {"type": "ephemeral"},
+    })
+    for agent_type, prompt in _PROMPTS.items()
+})
+
+
+def get_system_prompt_block(agent_type: str) -> Mapping:
+    """Get system prompt as a cacheable Anthropic text block"""
+    return PROMPT_BLOCKS.get(agent_type, PROMPT_BLOCKS["tutor"])
@@ -2,10 +2,18 @@
 AI Tool Handlers
 Implements the actual execution logic for each AI-callable tool
 """
-from typing import Dict
+from typing import Dict, List
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne, WriteConcern
 from bson import ObjectId
-from datetime import datetime
+from datetime import datetime, timezone
+import json
+
+# AI-generated content is regenerable, so acknowledge writes without waiting on the journal
+GENERATED_WRITE_CONCERN = WriteConcern(w=1, j=False)
+
+# Maximum progress upserts sent in one bulk_write
+PROGRESS_BATCH_SIZE = 50
 
 
 class AIToolHandlers:
@@ -14,6 +22,7 @@ class AIToolHandlers:
     def __init__(self, db: AsyncIOMotorDatabase, user_id: str):
         self.db = db
         self.user_id = user_id
+        self._progress_pending: List[UpdateOne] = []
 
     async def handle_display_learning_content(self, input_data: Dict) -> Dict:
         """
@@ -34,10 +43,12 @@ class AIToolHandlers:
             "sections": input_data["sections"],
             "created_for_user": self.user_id,
             "generated_by_ai": True,
-            "created_at": datetime.utcnow()
+            "created_at": datetime.now(timezone.utc)
         }
 
-        await self.db.learning_content.insert_one(content_doc)
+        await self.db.learning_content.with_options(
+            write_concern=GENERATED_WRITE_CONCERN
+        ).insert_one(content_doc)
 
         return {
             "success": True,
@@ -62,21 +73,21 @@ class AIToolHandlers:
         test_cases_input = input_data.get("test_cases", [])
         if isinstance(test_cases_input, str):
             # Parse JSON string
-            import json
             try:
                 test_cases_input = json.loads(test_cases_input)
             except json.JSONDecodeError:
                 test_cases_input = []
 
-        test_cases = []
-        for tc in test_cases_input:
-            test_cases.append({
+        test_cases = [
+            {
                 "test_id": tc["test_id"],
                 "description": tc["description"],
                 "input": tc.get("input", {}),
                 "expected_output": tc.get("expected_output", {"stdout": ""}),
                 "validation_script": tc["validation_script"]
-            })
+            }
+            for tc in test_cases_input
+        ]
 
         # If no test cases provided, create a basic one using validation_script
         if not test_cases:
@@ -107,10 +118,12 @@ class AIToolHandlers:
             },
             "generated_by_ai": True,
             "created_for_user": self.user_id,
-            "created_at": datetime.utcnow()
+            "created_at": datetime.now(timezone.utc)
         }
 
-        await self.db.exercises.insert_one(exercise_doc)
+        await self.db.exercises.with_options(
+            write_concern=GENERATED_WRITE_CONCERN
+        ).insert_one(exercise_doc)
 
         return {
             "success": True,
@@ -156,7 +169,7 @@ class AIToolHandlers:
             "strengths": input_data.get("strengths", []),
             "improvements": input_data.get("improvements", []),
             "next_action": input_data["next_action"],
-            "created_at": datetime.utcnow()
+            "created_at": datetime.now(timezone.utc).isoformat()
         }
 
         return {
@@ -178,8 +191,8 @@ class AIToolHandlers:
         status = input_data["status"]
         completion_percentage = input_data.get("completion_percentage", 0)
 
-        # Update user progress for this node
-        await self.db.user_progress.update_one(
+        # Queue the upsert; flush_progress writes all of a turn's updates together
+        self._progress_pending.append(UpdateOne(
             {
                 "user_id": self.user_id,
                 "node_id": node_id
@@ -188,13 +201,20 @@ class AIToolHandlers:
                 "$set": {
                     "status": status,
                     "completion_percentage": completion_percentage,
-                    "updated_at": datetime.utcnow()
+                    "updated_at": datetime.now(timezone.utc)
                 }
             },
             upsert=True
-        )
+        ))
 
         return {
             "success": True,
-            "message": f"Progress updated: {node_id} - {status} ({completion_percentage}%)"
+            "message": f"Progress update recorded: {node_id} - {status} ({completion_percentage}%)"
         }
+
+    async def flush_progress(self):
+        """Write queued progress updates in ordered batches"""
+        pending, self._progress_pending = self._progress_pending, []
+        for i in range(0, len(pending), PROGRESS_BATCH_SIZE):
+            # Ordered, so repeated updates to one node apply in call order
+            await self.db.user_progress.bulk_write(pending[i:i + PROGRESS_BATCH_SIZE])
@@ -2,221 +2,237 @@
 Tool Registry for AI Tool Calling
 Centralizes tool definitions and execution routing
 """
-from typing import List, Dict
+from typing import Callable, List, Dict
+import logging
 from motor.motor_asyncio import AsyncIOMotorDatabase
-import json
+import orjson
 
 from app.ai.tool_handlers import AIToolHandlers
 
+logger = logging.getLogger(__name__)
 
-class ToolRegistry:
-    """Registry for AI-callable tools with Claude API definitions"""
-
-    def __init__(self, db: AsyncIOMotorDatabase, user_id: str):
-        self.db = db
-        self.user_id = user_id
-        self.handlers = AIToolHandlers(db, user_id)
-        self.tools = {}
-        self._register_tools()
 
-    def _register_tools(self):
-        """Register all available tools with their Claude API definitions"""
-
-        # Tool 1: Display Learning Content
-        self.tools["display_learning_content"] = {
-            "name": "display_learning_content",
-            "description": "Display educational content (notes, explanations, concept breakdowns) to the user. Use this to teach concepts before exercises or provide custom notes.",
-            "input_schema": {
-                "type": "object",
-                "properties": {
-                    "title": {
-                        "type": "string",
-                        "description": "Title of the content"
-                    },
-                    "content_type": {
-                        "type": "string",
-                        "enum": ["note", "explanation", "example", "summary", "reference"],
-                        "description": "Type of educational content"
-                    },
-                    "sections": {
-                        "type": "array",
-                        "description": "Content broken into sections",
-                        "items": {
-                            "type": "object",
-                            "properties": {
-                                "heading": {
-                                    "type": "string",
-                                    "description": "Section heading"
-                                },
-                                "body": {
-                                    "type": "string",
-                                    "description": "Main content in Markdown format"
-                                },
-                                "code_example": {
-                                    "type": "string",
-                                    "description": "Optional code snippet"
-                                },
-                                "language": {
-                                    "type": "string",
-                                    "description": "Programming language of code example"
-                                }
+# Claude API tool definitions; built once and shared read-only by every registry
+_TOOL_DEFINITIONS: Dict[str, Dict] = {
+    # Tool 1: Display Learning Content
+    "display_learning_content": {
+        "name": "display_learning_content",
+        "description": "Display educational content (notes, explanations, concept breakdowns) to the user. Use this to teach concepts before exercises or provide custom notes.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "title": {
+                    "type": "string",
+                    "description": "Title of the content"
+                },
+                "content_type": {
+                    "type": "string",
+                    "enum": ["note", "explanation", "example", "summary", "reference"],
+                    "description": "Type of educational content"
+                },
+                "sections": {
+                    "type": "array",
+                    "description": "Content broken into sections",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "heading": {
+                                "type": "string",
+                                "description": "Section heading"
                             },
-                            "required": ["heading", "body"]
-                        }
+                            "body": {
+                                "type": "string",
+                                "description": "Main content in Markdown format"
+                            },
+                            "code_example": {
+                                "type": "string",
+                                "description": "Optional code snippet"
+                            },
+                            "language": {
+                                "type": "string",
+                                "description": "Programming language of code example"
+                            }
+                        },
+                        "required": ["heading", "body"]
                     }
-                },
-                "required": ["title", "content_type", "sections"]
-            }
+                }
+            },
+            "required": ["title", "content_type", "sections"]
         }
+    },
 
-        # Tool 2: Generate Exercise
-        self.tools["generate_exercise"] = {
-            "name": "generate_exercise",
-            "description": "Generate a coding exercise dynamically based on the topic and user's skill level. Creates a new practice problem with test cases.",
-            "input_schema": {
-                "type": "object",
-                "properties": {
-                    "title": {
-                        "type": "string",
-                        "description": "Short, descriptive title for the exercise"
-                    },
-                    "description": {
-                        "type": "string",
-                        "description": "Brief description of what this exercise teaches"
-                    },
-                    "prompt": {
-                        "type": "string",
-                        "description": "Detailed instructions for the student"
-                    },
-                    "difficulty": {
-                        "type": "string",
-                        "enum": ["beginner", "intermediate", "advanced"],
-                        "description": "Difficulty level"
-                    },
-                    "exercise_type": {
-                        "type": "string",
-                        "enum": ["python", "bash", "terraform", "pulumi", "ansible"],
-                        "description": "Programming language or tool"
-                    },
-                    "starter_code": {
-                        "type": "string",
-                        "description": "Initial code template"
-                    },
-                    "solution": {
-                        "type": "string",
-                        "description": "Complete solution code"
-                    },
-                    "test_cases": {
-                        "type": "array",
-                        "description": "Test cases to validate solution",
-                        "items": {
-                            "type": "object",
-                            "properties": {
-                                "test_id": {"type": "string"},
-                                "description": {"type": "string"},
-                                "validation_script": {"type": "string"}
-                            },
-                            "required": ["test_id", "description", "validation_script"]
-                        }
-                    },
-                    "node_id": {
-                        "type": "string",
-                        "description": "Associated learning node"
+    # Tool 2: Generate Exercise
+    "generate_exercise": {
+        "name": "generate_exercise",
+        "description": "Generate a coding exercise dynamically based on the topic and user's skill level. Creates a new practice problem with test cases.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "title": {
+                    "type": "string",
+                    "description": "Short, descriptive title for the exercise"
+                },
+                "description": {
+                    "type": "string",
+                    "description": "Brief description of what this exercise teaches"
+                },
+                "prompt": {
+                    "type": "string",
+                    "description": "Detailed instructions for the student"
+                },
+                "difficulty": {
+                    "type": "string",
+                    "enum": ["beginner", "intermediate", "advanced"],
+                    "description": "Difficulty level"
+                },
+                "exercise_type": {
+                    "type": "string",
+                    "enum": ["python", "bash", "terraform", "pulumi", "ansible"],
+                    "description": "Programming language or tool"
+                },
+                "starter_code": {
+                    "type": "string",
+                    "description": "Initial code template"
+                },
+                "solution": {
+                    "type": "string",
+                    "description": "Complete solution code"
+                },
+                "test_cases": {
+                    "type": "array",
+                    "description": "Test cases to validate solution",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "test_id": {"type": "string"},
+                            "description": {"type": "string"},
+                            "validation_script": {"type": "string"}
+                        },
+                        "required": ["test_id", "description", "validation_script"]
                     }
                 },
-                "required": ["title", "description", "prompt", "difficulty", "exercise_type", "solution"]
-            }
+                "node_id": {
+                    "type": "string",
+                    "description": "Associated learning node"
+                }
+            },
+            "required": ["title", "description", "prompt", "difficulty", "exercise_type", "solution"]
         }
+    },
 
-        # Tool 3: Navigate to Next Step
-        self.tools["navigate_to_next_step"] = {
-            "name": "navigate_to_next_step",
-            "description": "Control the learning flow by navigating the user to the next step. Use after completing current task to automatically move them forward.",
-            "input_schema": {
-                "type": "object",
-                "properties": {
-                    "action": {
-                        "type": "string",
-                        "enum": ["show_exercise", "show_content", "complete_node", "take_break", "review_concepts"],
-                        "description": "What should happen next"
-                    },
-                    "message": {
-                        "type": "string",
-                        "description": "Brief message explaining what's next"
-                    },
-                    "target_id": {
-                        "type": "string",
-                        "description": "ID of exercise or content to show"
-                    },
-                    "auto_navigate_delay": {
-                        "type": "integer",
-                        "description": "Seconds to wait before auto-navigating (default: 3)"
-                    }
+    # Tool 3: Navigate to Next Step
+    "navigate_to_next_step": {
+        "name": "navigate_to_next_step",
+        "description": "Control the learning flow by navigating the user to the next step. Use after completing current task to automatically move them forward.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "action": {
+                    "type": "string",
+                    "enum": ["show_exercise", "show_content", "complete_node", "take_break", "review_concepts"],
+                    "description": "What should happen next"
                 },
-                "required": ["action", "message"]
-            }
+                "message": {
+                    "type": "string",
+                    "description": "Brief message explaining what's next"
+                },
+                "target_id": {
+                    "type": "string",
+                    "description": "ID of exercise or content to show"
+                },
+                "auto_navigate_delay": {
+                    "type": "integer",
+                    "description": "Seconds to wait before auto-navigating (default: 3)"
+                }
+            },
+            "required": ["action", "message"]
         }
+    },
 
-        # Tool 4: Provide Feedback
-        self.tools["provide_feedback"] = {
-            "name": "provide_feedback",
-            "description": "Provide personalized feedback on user's exercise submission. Use after evaluating their code to guide improvement.",
-            "input_schema": {
-                "type": "object",
-                "properties": {
-                    "feedback_type": {
-                        "type": "string",
-                        "enum": ["success", "partial_success", "needs_improvement", "excellent"],
-                        "description": "Overall assessment"
-                    },
-                    "message": {
-                        "type": "string",
-                        "description": "Main feedback message"
-                    },
-                    "strengths": {
-                        "type": "array",
-                        "items": {"type": "string"},
-                        "description": "What the student did well"
-                    },
-                    "improvements": {
-                        "type": "array",
-                        "items": {"type": "string"},
-                        "description": "Areas to improve"
-                    },
-                    "next_action": {
-                        "type": "string",
-                        "description": "What student should do next"
-                    }
+    # Tool 4: Provide Feedback
+    "provide_feedback": {
+        "name": "provide_feedback",
+        "description": "Provide personalized feedback on user's exercise submission. Use after evaluating their code to guide improvement.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "feedback_type": {
+                    "type": "string",
+                    "enum": ["success", "partial_success", "needs_improvement", "excellent"],
+                    "description": "Overall assessment"
                 },
-                "required": ["feedback_type", "message", "next_action"]
-            }
+                "message": {
+                    "type": "string",
+                    "description": "Main feedback message"
+                },
+                "strengths": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "What the student did well"
+                },
+                "improvements": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "description": "Areas to improve"
+                },
+                "next_action": {
+                    "type": "string",
+                    "description": "What student should do next"
+                }
+            },
+            "required": ["feedback_type", "message", "next_action"]
         }
+    },
 
-        # Tool 5: Update User Progress
-        self.tools["update_user_progress"] = {
-            "name": "update_user_progress",
-            "description": "Update the user's learning progress. Use when user completes exercises or milestones.",
-            "input_schema": {
-                "type": "object",
-                "properties": {
-                    "node_id": {
-                        "type": "string",
-                        "description": "Learning node ID"
-                    },
-                    "status": {
-                        "type": "string",
-                        "enum": ["not_started", "in_progress", "completed"],
-                        "description": "Current status"
-                    },
-                    "completion_percentage": {
-                        "type": "integer",
-                        "minimum": 0,
-                        "maximum": 100,
-                        "description": "Percentage completed"
-                    }
+    # Tool 5: Update User Progress
+    "update_user_progress": {
+        "name": "update_user_progress",
+        "description": "Update the user's learning progress. Use when user completes exercises or milestones.",
+        "input_schema": {
+            "type": "object",
+            "properties": {
+                "node_id": {
+                    "type": "string",
+                    "description": "Learning node ID"
+                },
+                "status": {
+                    "type": "string",
+                    "enum": ["not_started", "in_progress", "completed"],
+                    "description": "Current status"
                 },
-                "required": ["node_id", "status"]
-            }
+                "completion_percentage": {
+                    "type": "integer",
+                    "minimum": 0,
+                    "maximum": 100,
+                    "description": "Percentage completed"
+                }
+            },
+            "required": ["node_id", "status"]
+        }
+    },
+}
+
+_TOOL_DEFINITIONS_LIST = list(_TOOL_DEFINITIONS.values())
+
+# Tool name -> required input keys, checked before dispatch so a malformed call
+# fails with a clear error instead of a KeyError inside the handler
+_TOOL_REQUIRED_KEYS: Dict[str, frozenset] = {
+    name: frozenset(tool["input_schema"].get("required", ()))
+    for name, tool in _TOOL_DEFINITIONS.items()
+}
+
+
+class ToolRegistry:
+    """Registry for AI-callable tools with Claude API definitions"""
+
+    def __init__(self, db: AsyncIOMotorDatabase, user_id: str):
+        self.db = db
+        self.user_id = user_id
+        self.handlers = AIToolHandlers(db, user_id)
+        self.tools = _TOOL_DEFINITIONS
+        # Tool name -> bound handler, resolved once instead of per call
+        self._dispatch: Dict[str, Callable] = {
+            name: getattr(self.handlers, f"handle_{name}", None) for name in self.tools
         }
 
     async def execute_tool(self, tool_name: str, tool_input: Dict) -> str:
@@ -230,24 +246,46 @@ class ToolRegistry:
         Returns:
             JSON string with tool execution result
         """
-        if tool_name not in self.tools:
-            return json.dumps({"error": f"Unknown tool: {tool_name}"})
+        if tool_name not in self._dispatch:
+            return orjson.dumps({"error": f"Unknown tool: {tool_name}"}).decode()
 
         try:
             # Route to appropriate handler
-            handler = getattr(self.handlers, f"handle_{tool_name}", None)
+            handler = self._dispatch[tool_name]
 
             if not handler:
-                return json.dumps({"error": f"No handler for tool: {tool_name}"})
+                return orjson.dumps({"error": f"No handler for tool: {tool_name}"}).decode()
+
+            if not isinstance(tool_input, dict):
+                return orjson.dumps({"error": "Invalid input: expected an object"}).decode()
+
+            missing = _TOOL_REQUIRED_KEYS[tool_name] - tool_input.keys()
+            if missing:
+                return orjson.dumps({
+                    "error": f"Invalid input: missing {', '.join(sorted(missing))}",
+                    "tool_name": tool_name
+                }).decode()
 
             result = await handler(tool_input)
-            return json.dumps(result)
+            return orjson.dumps(result).decode()
 
         except Exception as e:
-            return json.dumps({
+            return orjson.dumps({
                 "error": f"Tool execution failed: {str(e)}",
                 "tool_name": tool_name
-            })
+            }).decode()
+
+    async def flush(self):
+        """
+        Write any tool side effects deferred until the end of the turn
+
+        Never raises: a failed write is logged rather than turning a finished
+        turn into an error or masking the exception of a failed one.
+        """
+        try:
+            await self.handlers.flush_progress()
+        except Exception:
+            logger.exception("❌ Failed to write queued progress updates for user %s", self.user_id)
 
     def get_tool_definitions(self) -> List[Dict]:
         """
@@ -256,4 +294,4 @@ class ToolRegistry:
         Returns:
             List of tool definition dictionaries
         """
-        return list(self.tools.values())
+        return _TOOL_DEFINITIONS_LIST
@@ -1,8 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from motor.motor_asyncio import AsyncIOMotorDatabase
-from datetime import datetime
+from pymongo import WriteConcern
+from pymongo.errors import DuplicateKeyError
+from bson import ObjectId
+from datetime import datetime, timezone
 from pydantic import BaseModel
-from app.dependencies import get_db, get_current_user
+import asyncio
+from app.db.mongodb import Collections
+from app.dependencies import get_cols, get_current_user
 from app.models.user import (
     UserCreate,
     UserLogin,
@@ -16,39 +20,44 @@ from app.utils.security import (
     get_password_hash,
     create_access_token
 )
+from app.utils.routing import ORJSONRoute
 
-router = APIRouter(prefix="/auth", tags=["Authentication"])
+router = APIRouter(prefix="/auth", tags=["Authentication"], route_class=ORJSONRoute)
+
+# Fields read by login
+LOGIN_PROJECTION = {"email": 1, "full_name": 1, "password_hash": 1, "onboarding_completed": 1}
+
+# last_login is informational, so its update is sent without waiting for an ack
+LAST_LOGIN_WRITE_CONCERN = WriteConcern(w=0)
 
 
 @router.post("/register", response_model=dict, status_code=status.HTTP_201_CREATED)
 async def register(
     user_data: UserCreate,
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    cols: Collections = Depends(get_cols)
 ):
     """Register a new user"""
 
-    # Check if user already exists
-    existing_user = await db.users.find_one({"email": user_data.email})
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
-        )
+    # bcrypt is deliberately slow; hash off the event loop
+    password_hash = await asyncio.to_thread(get_password_hash, user_data.password)
+
+    # Pre-generate the id so the user and progress state can be inserted together
+    user_oid = ObjectId()
+    user_id = str(user_oid)
+    now = datetime.now(timezone.utc)
 
     # Create user
     user_dict = {
+        "_id": user_oid,
         "email": user_data.email,
         "full_name": user_data.full_name,
-        "password_hash": get_password_hash(user_data.password),
-        "created_at": datetime.utcnow(),
+        "password_hash": password_hash,
+        "created_at": now,
         "last_login": None,
         "onboarding_completed": False,
-        "settings": UserSettings().dict()
+        "settings": UserSettings().model_dump()
     }
 
-    result = await db.users.insert_one(user_dict)
-    user_id = str(result.inserted_id)
-
     # Initialize progress state for new user
     progress_state = {
         "user_id": user_id,
@@ -63,9 +72,29 @@ async def register(
             "streak_days": 0,
             "last_activity": None
         },
-        "updated_at": datetime.utcnow()
+        # Copy of settings.pace_preference, so stats needn't read users
+        "pace_preference": user_dict["settings"]["pace_preference"],
+        "updated_at": now
     }
-    await db.progress_state.insert_one(progress_state)
+
+    # The unique email index rejects duplicates, including concurrent registrations
+    user_result, progress_result = await asyncio.gather(
+        cols.users.insert_one(user_dict),
+        cols.progress_state.insert_one(progress_state),
+        return_exceptions=True
+    )
+    if isinstance(user_result, Exception):
+        await cols.progress_state.delete_one({"_id": progress_state["_id"]})
+        if isinstance(user_result, DuplicateKeyError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Email already registered"
+            )
+        raise user_result
+    if isinstance(progress_result, Exception):
+        # Don't leave a user without progress state behind
+        await cols.users.delete_one({"_id": user_oid})
+        raise progress_result
 
     return {
         "user_id": user_id,
@@ -76,29 +105,31 @@ async def register(
 @router.post("/login", response_model=dict)
 async def login(
     credentials: UserLogin,
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    cols: Collections = Depends(get_cols)
 ):
     """Login user and return JWT token"""
 
     # Find user
-    user = await db.users.find_one({"email": credentials.email})
+    user = await cols.users.find_one({"email": credentials.email}, LOGIN_PROJECTION)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
         )
 
-    # Verify password
-    if not verify_password(credentials.password, user["password_hash"]):
+    # Verify password off the event loop
+    if not await asyncio.to_thread(
+        verify_password, credentials.password, user["password_hash"]
+    ):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
         )
 
-    # Update last login
-    await db.users.update_one(
+    # Update last login (unacknowledged, so no round trip is awaited)
+    await cols.users.with_options(write_concern=LAST_LOGIN_WRITE_CONCERN).update_one(
         {"_id": user["_id"]},
-        {"$set": {"last_login": datetime.utcnow()}}
+        {"$set": {"last_login": datetime.now(timezone.utc)}}
     )
 
     # Create access token
@@ -153,10 +184,10 @@ class SettingsUpdate(BaseModel):
 async def update_profile(
     data: ProfileUpdate,
     current_user: dict = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    cols: Collections = Depends(get_cols)
 ):
     """Update user profile"""
-    await db.users.update_one(
+    await cols.users.update_one(
         {"_id": current_user["_id"]},
         {"$set": {"full_name": data.full_name}}
     )
@@ -167,11 +198,18 @@ async def update_profile(
 async def update_settings(
     data: SettingsUpdate,
     current_user: dict = Depends(get_current_user),
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    cols: Collections = Depends(get_cols)
 ):
     """Update user settings"""
-    await db.users.update_one(
-        {"_id": current_user["_id"]},
-        {"$set": {"settings": data.settings}}
+    await asyncio.gather(
+        cols.users.update_one(
+            {"_id": current_user["_id"]},
+            {"$set": {"settings": data.settings}}
+        ),
+        # Keep the copy on progress_state in sync
+        cols.progress_state.update_one(
+            {"user_id": str(current_user["_id"])},
+            {"$set": {"pace_preference": data.settings.get("pace_preference", "medium")}}
+        )
     )
     return {"message": "Settings updated successfully"}
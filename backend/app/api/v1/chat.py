@@ -2,16 +2,21 @@
 Chat API endpoints for AI tutor interactions
 """
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from pydantic import BaseModel
 from typing import Optional, List
+from bson import ObjectId
+import orjson
 
 from app.dependencies import get_db, get_current_user_id
 from app.ai.agents.tutor_agent import TutorAgent
 from app.ai.agents.hint_agent import HintAgent
 from app.ai.chat_service import ChatService
+from app.ai.dependencies import get_chat_service, get_hint_agent, get_tutor
+from app.utils.routing import ORJSONRoute
 
-router = APIRouter(prefix="/chat", tags=["chat"])
+router = APIRouter(prefix="/chat", tags=["chat"], route_class=ORJSONRoute)
 
 
 class ChatMessageRequest(BaseModel):
@@ -27,32 +32,76 @@ class HintRequest(BaseModel):
     user_code: Optional[str] = ""
 
 
+# context_type -> (collection, id field) for documents attached to a chat turn
+_CONTEXT_LOOKUPS = {
+    "exercise": ("exercises", "exercise_id"),
+    "node": ("learning_nodes", "node_id"),
+}
+
+# Only the fields the tutor's context formatter reads
+_CONTEXT_PROJECTION = {"_id": 0, "title": 1, "description": 1, "difficulty": 1}
+
+# Chat messages as returned by the history API, with JSON-ready ids
+_HISTORY_PROJECTION = {
+    "_id": {"$toString": "$_id"},
+    "role": 1,
+    "content": 1,
+    "created_at": 1,
+}
+
+
+async def _fetch_context(
+    db: AsyncIOMotorDatabase, context_type: Optional[str], context_id: Optional[str]
+) -> Optional[dict]:
+    """Fetch the exercise or node a chat turn refers to with a single query"""
+    lookup = _CONTEXT_LOOKUPS.get(context_type)
+    if not lookup or not context_id:
+        return None
+
+    collection, id_field = lookup
+    return await db[collection].find_one({id_field: context_id}, _CONTEXT_PROJECTION)
+
+
+async def _build_chat_context(
+    request: ChatMessageRequest, db: AsyncIOMotorDatabase
+) -> Optional[dict]:
+    """Build the context data sent alongside a chat message"""
+    context_data = None
+    if request.user_code:
+        context_data = {"user_code": request.user_code}
+
+    # If we have a context_id, fetch relevant details once and pass them through
+    doc = await _fetch_context(db, request.context_type, request.context_id)
+    if doc:
+        context_data = context_data or {}
+        context_data[request.context_type] = doc
+
+    return context_data
+
+
+async def _get_owned_session(
+    db: AsyncIOMotorDatabase, session_id: str, user_id: str
+) -> dict:
+    """Fetch a chat session's owner, raising 404 unless it belongs to the user"""
+    session = None
+    if ObjectId.is_valid(session_id):
+        session = await db.chat_sessions.find_one(
+            {"_id": ObjectId(session_id)}, {"user_id": 1}
+        )
+    if not session or session["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+
 @router.post("/message")
 async def send_chat_message(
     request: ChatMessageRequest,
     user_id: str = Depends(get_current_user_id),
     db: AsyncIOMotorDatabase = Depends(get_db),
+    tutor: TutorAgent = Depends(get_tutor),
 ):
     """Send a message to the AI tutor"""
-    tutor = TutorAgent(db)
-
-    # Build context data if provided
-    context_data = None
-    if request.user_code:
-        context_data = {"user_code": request.user_code}
-
-    # If we have a context_id, fetch relevant details
-    if request.context_id:
-        if request.context_type == "exercise":
-            exercise = await db.exercises.find_one({"_id": request.context_id})
-            if exercise:
-                context_data = context_data or {}
-                context_data["exercise"] = exercise
-        elif request.context_type == "node":
-            node = await db.nodes.find_one({"_id": request.context_id})
-            if node:
-                context_data = context_data or {}
-                context_data["node"] = node
+    context_data = await _build_chat_context(request, db)
 
     response = await tutor.ask_question(
         user_id=user_id,
@@ -65,55 +114,81 @@ async def send_chat_message(
     return response
 
 
+@router.post("/message/stream")
+async def stream_chat_message(
+    request: ChatMessageRequest,
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    tutor: TutorAgent = Depends(get_tutor),
+):
+    """Send a message to the AI tutor and stream the reply as server-sent events"""
+    context_data = await _build_chat_context(request, db)
+
+    async def event_stream():
+        async for event in tutor.ask_question_stream(
+            user_id=user_id,
+            question=request.message,
+            context_type=request.context_type,
+            context_id=request.context_id,
+            context_data=context_data,
+        ):
+            yield b"data: " + orjson.dumps(event) + b"\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 @router.post("/hint")
 async def get_hint(
     request: HintRequest,
     user_id: str = Depends(get_current_user_id),
-    db: AsyncIOMotorDatabase = Depends(get_db),
+    hint_agent: HintAgent = Depends(get_hint_agent),
 ):
     """Get a progressive hint for an exercise"""
-    hint_agent = HintAgent(db)
-
-    # Get user's attempt count for this exercise
-    attempts = await db.attempts.count_documents(
-        {"user_id": user_id, "exercise_id": request.exercise_id}
-    )
-
     try:
+        # The agent counts prior attempts alongside its exercise lookup
         hint = await hint_agent.generate_hint(
             user_id=user_id,
             exercise_id=request.exercise_id,
             hint_level=request.hint_level,
             user_code=request.user_code,
-            previous_attempts=attempts,
         )
         return hint
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
 
+async def _stream_history(chat_service: ChatService, session_oid: ObjectId, session_id: str):
+    """Encode history as one JSON object, a message at a time"""
+    yield b'{"session_id":' + orjson.dumps(session_id) + b',"messages":['
+    first = True
+    async for message in chat_service.iter_session_history(
+        session_oid, projection=_HISTORY_PROJECTION
+    ):
+        if not first:
+            yield b","
+        first = False
+        yield orjson.dumps(message)
+    yield b"]}"
+
+
 @router.get("/history/{session_id}")
 async def get_chat_history(
     session_id: str,
     user_id: str = Depends(get_current_user_id),
     db: AsyncIOMotorDatabase = Depends(get_db),
+    chat_service: ChatService = Depends(get_chat_service),
 ):
     """Get chat history for a session"""
-    chat_service = ChatService(db)
-
-    # Verify session belongs to user
-    session = await db.chat_sessions.find_one({"_id": session_id})
-    if not session or session["user_id"] != user_id:
-        raise HTTPException(status_code=404, detail="Session not found")
-
-    history = await chat_service.get_session_history(session_id)
-
-    # Convert ObjectIds to strings for JSON serialization
-    for msg in history:
-        if "_id" in msg:
-            msg["_id"] = str(msg["_id"])
-
-    return {"session_id": session_id, "messages": history}
+    # Verify session belongs to user before the response starts
+    session = await _get_owned_session(db, session_id, user_id)
+
+    # session_id is already in the response, so leave out the per-message copy;
+    # _id is stringified by the server instead of a per-document loop here.
+    # Messages are streamed as the cursor yields them rather than buffered.
+    return StreamingResponse(
+        _stream_history(chat_service, session["_id"], session_id),
+        media_type="application/json",
+    )
 
 
 @router.get("/sessions")
@@ -123,16 +198,13 @@ async def get_user_sessions(
     limit: int = 10,
 ):
     """Get user's recent chat sessions"""
-    sessions = (
-        await db.chat_sessions.find({"user_id": user_id})
-        .sort("updated_at", -1)
-        .limit(limit)
-        .to_list(length=limit)
-    )
-
-    # Convert ObjectIds to strings
-    for session in sessions:
-        session["_id"] = str(session["_id"])
+    # ObjectIds are converted to strings in the pipeline
+    sessions = await db.chat_sessions.aggregate([
+        {"$match": {"user_id": user_id}},
+        {"$sort": {"updated_at": -1}},
+        {"$limit": limit},
+        {"$set": {"_id": {"$toString": "$_id"}}},
+    ]).to_list(length=limit)
 
     return {"sessions": sessions}
 
@@ -142,14 +214,12 @@ async def close_session(
     session_id: str,
     user_id: str = Depends(get_current_user_id),
     db: AsyncIOMotorDatabase = Depends(get_db),
+    chat_service: ChatService = Depends(get_chat_service),
 ):
     """Close a chat session"""
     # Verify session belongs to user
-    session = await db.chat_sessions.find_one({"_id": session_id})
-    if not session or session["user_id"] != user_id:
-        raise HTTPException(status_code=404, detail="Session not found")
+    await _get_owned_session(db, session_id, user_id)
 
-    chat_service = ChatService(db)
     await chat_service.close_session(session_id)
 
     return {"message": "Session closed", "session_id": session_id}
@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional
 from bson import ObjectId
-from app.dependencies import get_db, get_current_user_id
+import asyncio
+from app.db.mongodb import Collections
+from app.dependencies import get_cols, get_db, get_current_user_id
 from app.models.exercise import (
     ExerciseResponse,
     ExerciseSubmit,
@@ -11,34 +13,38 @@ from app.models.exercise import (
     ExerciseAttemptInDB
 )
 from app.services.grading_service import grade_exercise
+from app.services.exercise_cache import get_exercise_cached
+from app.services.dashboard_cache import invalidate_dashboard
+from app.utils.routing import ORJSONRoute
 
-router = APIRouter(prefix="/exercises", tags=["Exercises"])
+router = APIRouter(prefix="/exercises", tags=["Exercises"], route_class=ORJSONRoute)
 
 
 @router.get("/{exercise_id}", response_model=dict)
 async def get_exercise(
     exercise_id: str,
     user_id: str = Depends(get_current_user_id),
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    cols: Collections = Depends(get_cols)
 ):
     """Get exercise details"""
 
-    exercise = await db.exercises.find_one({"exercise_id": exercise_id})
+    exercise = await get_exercise_cached(cols.exercises, exercise_id)
     if not exercise:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Exercise not found"
         )
 
-    # Get user's attempt history
-    attempts = await db.exercise_attempts.find({
-        "user_id": user_id,
-        "exercise_id": exercise_id
-    }).to_list(length=100)
+    # Summarise the user's attempt history server-side
+    summary = await cols.exercise_attempts.aggregate([
+        {"$match": {"user_id": user_id, "exercise_id": exercise_id}},
+        {"$group": {"_id": None, "count": {"$sum": 1}, "best": {"$max": "$score"}}}
+    ]).to_list(length=1)
 
-    best_score = 0
-    if attempts:
-        best_score = max(att.get("score", 0) for att in attempts)
+    attempt_count, best_score = 0, 0
+    if summary:
+        attempt_count = summary[0]["count"]
+        best_score = summary[0]["best"] or 0
 
     return {
         "exercise": {
@@ -51,41 +57,72 @@ async def get_exercise(
             "difficulty": exercise["difficulty"]
         },
         "user_progress": {
-            "attempts": len(attempts),
+            "attempts": attempt_count,
             "best_score": best_score,
             "completed": best_score >= 70
         }
     }
 
 
+async def _insert_and_grade(
+    db: AsyncIOMotorDatabase,
+    cols: Collections,
+    attempt: dict,
+    language: str
+):
+    """Store a submitted attempt and grade it, overlapping the insert with the run"""
+    insert_task = asyncio.ensure_future(cols.exercise_attempts.insert_one(attempt))
+    try:
+        await grade_exercise(
+            db,
+            str(attempt["_id"]),
+            attempt["exercise_id"],
+            attempt["submitted_code"],
+            language,
+            attempt_written=insert_task
+        )
+    finally:
+        # Surface an insert failure even if grading raised first
+        await insert_task
+    # The graded attempt changes the user's dashboard counts
+    await invalidate_dashboard(attempt["user_id"])
+
+
 @router.post("/{exercise_id}/submit", response_model=dict)
 async def submit_exercise(
     exercise_id: str,
     submission: ExerciseSubmit,
     background_tasks: BackgroundTasks,
     user_id: str = Depends(get_current_user_id),
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    cols: Collections = Depends(get_cols)
 ):
     """Submit exercise code for grading"""
 
-    # Verify exercise exists
-    exercise = await db.exercises.find_one({"exercise_id": exercise_id})
+    # Verify exercise exists and count attempts concurrently
+    exercise, attempt_count = await asyncio.gather(
+        get_exercise_cached(cols.exercises, exercise_id),
+        cols.exercise_attempts.count_documents({
+            "user_id": user_id,
+            "exercise_id": exercise_id
+        })
+    )
     if not exercise:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Exercise not found"
         )
 
-    # Count attempts
-    attempt_count = await db.exercise_attempts.count_documents({
-        "user_id": user_id,
-        "exercise_id": exercise_id
-    })
-
-    # Create attempt record
+    # Create attempt record; the id is generated here so it can be returned
+    # before the document is written
+    submission_oid = ObjectId()
+    submission_id = str(submission_oid)
     attempt = {
+        "_id": submission_oid,
         "user_id": user_id,
         "exercise_id": exercise_id,
+        # Denormalized so dashboard stats can group attempts without a join
+        "difficulty": exercise.get("difficulty", "beginner"),
         "attempt_number": attempt_count + 1,
         "submitted_code": submission.code,
         "execution_result": None,
@@ -93,20 +130,16 @@ async def submit_exercise(
         "score": 0,
         "feedback": "Grading in progress...",
         "ai_comments": "",
-        "submitted_at": datetime.utcnow(),
+        "submitted_at": datetime.now(timezone.utc),
         "graded_at": None
     }
 
-    result = await db.exercise_attempts.insert_one(attempt)
-    submission_id = str(result.inserted_id)
-
-    # Queue grading job in background
+    # Insert and grade in the background so the response doesn't wait on the write
     background_tasks.add_task(
-        grade_exercise,
+        _insert_and_grade,
         db,
-        submission_id,
-        exercise_id,
-        submission.code,
+        cols,
+        attempt,
         submission.language
     )
 
@@ -122,15 +155,22 @@ async def get_exercise_result(
     exercise_id: str,
     submission_id: str,
     user_id: str = Depends(get_current_user_id),
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    cols: Collections = Depends(get_cols)
 ):
     """Get exercise grading result"""
 
-    attempt = await db.exercise_attempts.find_one({
-        "_id": ObjectId(submission_id),
-        "user_id": user_id,
-        "exercise_id": exercise_id
-    })
+    # Fetch the attempt and the exercise concurrently
+    attempt, exercise = await asyncio.gather(
+        cols.exercise_attempts.find_one(
+            {
+                "_id": ObjectId(submission_id),
+                "user_id": user_id,
+                "exercise_id": exercise_id
+            },
+            {"score": 1, "test_results": 1, "feedback": 1, "graded_at": 1}
+        ),
+        get_exercise_cached(cols.exercises, exercise_id)
+    )
 
     if not attempt:
         raise HTTPException(
@@ -141,8 +181,6 @@ async def get_exercise_result(
     # Determine status
     status_value = "completed" if attempt.get("graded_at") else "grading"
 
-    # Get exercise for hints
-    exercise = await db.exercises.find_one({"exercise_id": exercise_id})
     hints_available = len(exercise.get("hints", [])) if exercise else 0
 
     return {
@@ -162,11 +200,11 @@ async def get_hint(
     exercise_id: str,
     hint_number: int,
     user_id: str = Depends(get_current_user_id),
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    cols: Collections = Depends(get_cols)
 ):
     """Get a hint for an exercise"""
 
-    exercise = await db.exercises.find_one({"exercise_id": exercise_id})
+    exercise = await get_exercise_cached(cols.exercises, exercise_id)
     if not exercise:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -174,15 +212,14 @@ async def get_hint(
         )
 
     hints = exercise.get("hints", [])
-    if hint_number < 1 or hint_number > len(hints):
+    hint_count = len(hints)
+    if hint_number < 1 or hint_number > hint_count:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid hint number"
         )
 
-    hint = hints[hint_number - 1]
-
     return {
-        "hint": hint["text"],
-        "hints_remaining": len(hints) - hint_number
+        "hint": hints[hint_number - 1]["text"],
+        "hints_remaining": hint_count - hint_number
     }
@@ -2,16 +2,42 @@
 Learning Session API
 Endpoints for AI-driven dynamic learning
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import ORJSONResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from pydantic import BaseModel
+from redis.asyncio import Redis
+from bson import ObjectId
+from bson.errors import InvalidId
 from typing import Optional
+import hashlib
+import logging
+import orjson
 
-from app.dependencies import get_db, get_current_user_id
+from app.dependencies import get_db, get_current_user_id, get_redis_client
 from app.ai.agents.learning_orchestrator import LearningOrchestrator
+from app.ai.dependencies import get_orchestrator
+from app.utils.http_cache import etag_matches, not_modified
 
 
-router = APIRouter(prefix="/learning-session", tags=["Learning Session"])
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/learning-session",
+    tags=["Learning Session"]
+)
+
+# Generated content never changes once stored
+CONTENT_CACHE_CONTROL = "private, max-age=86400, immutable"
+
+# How long AI feedback for an identical submission is reused
+SUBMISSION_FEEDBACK_TTL = 3600
+
+
+def _submission_cache_key(user_id: str, exercise_id: str, score: int, code: str) -> str:
+    """Exact-match key: same user, exercise, score and code get the same feedback"""
+    code_hash = hashlib.sha256(code.encode()).hexdigest()
+    return f"submission_feedback:{user_id}:{exercise_id}:{score}:{code_hash}"
 
 
 class ContinueLearningRequest(BaseModel):
@@ -31,7 +57,7 @@ class ExerciseSubmissionEvent(BaseModel):
 async def start_learning_session(
     node_id: str,
     user_id: str = Depends(get_current_user_id),
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    orchestrator: LearningOrchestrator = Depends(get_orchestrator)
 ):
     """
     Start AI-driven learning session for a node
@@ -46,8 +72,6 @@ async def start_learning_session(
         exercise_id: ID of generated exercise (if any)
         actions: List of actions for frontend to take
     """
-    orchestrator = LearningOrchestrator(db)
-
     try:
         result = await orchestrator.start_learning_session(user_id, node_id)
 
@@ -59,7 +83,7 @@ async def start_learning_session(
             "actions": result.get("actions", [])
         }
     except Exception as e:
-        print(f"❌ Error starting learning session: {str(e)}")
+        logger.exception("❌ Error starting learning session")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -67,7 +91,7 @@ async def start_learning_session(
 async def continue_learning(
     request: ContinueLearningRequest,
     user_id: str = Depends(get_current_user_id),
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    orchestrator: LearningOrchestrator = Depends(get_orchestrator)
 ):
     """
     Continue learning session with user message
@@ -81,8 +105,6 @@ async def continue_learning(
         exercise_id: ID of generated exercise (if any)
         actions: List of actions
     """
-    orchestrator = LearningOrchestrator(db)
-
     try:
         result = await orchestrator.continue_learning(
             user_id=user_id,
@@ -97,7 +119,7 @@ async def continue_learning(
             "actions": result.get("actions", [])
         }
     except Exception as e:
-        print(f"❌ Error continuing learning: {str(e)}")
+        logger.exception("❌ Error continuing learning")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -105,7 +127,9 @@ async def continue_learning(
 async def handle_exercise_submission_ai(
     request: ExerciseSubmissionEvent,
     user_id: str = Depends(get_current_user_id),
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    redis: Redis = Depends(get_redis_client),
+    orchestrator: LearningOrchestrator = Depends(get_orchestrator)
 ):
     """
     Notify AI that user submitted an exercise
@@ -120,13 +144,15 @@ async def handle_exercise_submission_ai(
         navigation: Next step instructions
         actions: List of actions
     """
-    from bson import ObjectId
-
-    orchestrator = LearningOrchestrator(db)
+    # Reject malformed ids before touching Mongo
+    try:
+        submission_oid = ObjectId(request.submission_id)
+    except InvalidId:
+        raise HTTPException(status_code=422, detail="Invalid submission_id")
 
     try:
         # Get submission results from database
-        attempt = await db.exercise_attempts.find_one({"_id": ObjectId(request.submission_id)})
+        attempt = await db.exercise_attempts.find_one({"_id": submission_oid})
 
         if not attempt:
             raise HTTPException(status_code=404, detail="Submission not found")
@@ -139,17 +165,28 @@ async def handle_exercise_submission_ai(
             "feedback": attempt.get("feedback", "")
         }
 
-        # AI analyzes and decides next step
-        result = await orchestrator.handle_exercise_submission(
-            user_id=user_id,
-            exercise_id=request.exercise_id,
-            code=request.code,
-            test_results=test_results
+        # Resubmitting identical code with the same result reuses the earlier
+        # analysis instead of another model call
+        cache_key = _submission_cache_key(
+            user_id, request.exercise_id, test_results["score"], request.code
         )
+        cached = await redis.get(cache_key)
+        if cached:
+            result = orjson.loads(cached)
+        else:
+            # AI analyzes and decides next step
+            result = await orchestrator.handle_exercise_submission(
+                user_id=user_id,
+                exercise_id=request.exercise_id,
+                code=request.code,
+                test_results=test_results
+            )
+            if "error" not in result:
+                await redis.set(cache_key, orjson.dumps(result), ex=SUBMISSION_FEEDBACK_TTL)
 
         # Store AI's response in the attempt
         await db.exercise_attempts.update_one(
-            {"_id": ObjectId(request.submission_id)},
+            {"_id": submission_oid},
             {
                 "$set": {
                     "ai_feedback": result.get("message"),
@@ -169,12 +206,13 @@ async def handle_exercise_submission_ai(
             "content_id": result.get("content_id")
         }
     except Exception as e:
-        print(f"❌ Error handling exercise submission: {str(e)}")
+        logger.exception("❌ Error handling exercise submission")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/content/{content_id}")
 async def get_dynamic_content(
+    request: Request,
     content_id: str,
     user_id: str = Depends(get_current_user_id),
     db: AsyncIOMotorDatabase = Depends(get_db)
@@ -184,15 +222,24 @@ async def get_dynamic_content(
 
     Returns the full content document with title, sections, code examples, etc.
     """
-    content = await db.learning_content.find_one({
-        "content_id": content_id,
-        "created_for_user": user_id
-    })
+    # Content is immutable, so its id is a valid ETag and a revalidation
+    # can be answered without reading it
+    etag = f'"{content_id}"'
+    if etag_matches(request, etag):
+        return not_modified(etag, CONTENT_CACHE_CONTROL)
+
+    # Leave out the MongoDB _id server-side
+    content = await db.learning_content.find_one(
+        {
+            "content_id": content_id,
+            "created_for_user": user_id
+        },
+        {"_id": 0}
+    )
 
     if not content:
         raise HTTPException(status_code=404, detail="Content not found")
 
-    # Remove MongoDB _id from response
-    content.pop("_id", None)
-
-    return content
+    return ORJSONResponse(
+        content, headers={"ETag": etag, "Cache-Control": CONTENT_CACHE_CONTROL}
+    )
@@ -1,14 +1,87 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from dataclasses import dataclass
 from typing import Optional, List
+from pymongo import UpdateOne
+import asyncio
 from app.dependencies import get_db, get_current_user_id
 from app.models.node import NodeResponse, NodeListItem, NodeProgress
+from app.services.progress_writer import progress_writer
+from app.utils.http_cache import json_with_etag
 
 router = APIRouter(prefix="/nodes", tags=["Nodes"])
 
+# Node views include the user's progress, which changes as they work, so the
+# browser keeps a private copy but revalidates it (cheap 304 via ETag) each time
+NODE_CACHE_CONTROL = "private, no-cache"
+
+# Fields shown in the node list; detail adds the node's content
+NODE_LIST_PROJECTION = {
+    "_id": 0,
+    "node_id": 1,
+    "title": 1,
+    "description": 1,
+    "difficulty": 1,
+    "estimated_duration": 1,
+    "prerequisites": 1,
+}
+NODE_DETAIL_PROJECTION = {
+    "_id": 0,
+    "node_id": 1,
+    "title": 1,
+    "description": 1,
+    "difficulty": 1,
+    "prerequisites": 1,
+    "skills_taught": 1,
+    "content": 1,
+}
+
+
+# Shared read-only default for nodes the user has no progress on
+_EMPTY: dict = {}
+
+
+@dataclass(slots=True)
+class _NodeListEntry:
+    """
+    Node list entry as serialized by orjson
+
+    Same fields, in the same order, as NodeListItem; a slotted dataclass is a
+    single allocation per node and orjson encodes it natively.
+    """
+    node_id: str
+    title: str
+    description: str
+    difficulty: str
+    estimated_duration: int
+    prerequisites: List[str]
+    locked: bool
+    completion_status: str
+    completion_percentage: int
+
+
+def _node_list_item(node: dict, completed_nodes: frozenset, node_progress_map: dict) -> _NodeListEntry:
+    """Node list entry with the user's lock state and progress"""
+    prerequisites = node.get("prerequisites", [])
+    node_progress_data = node_progress_map.get(node["node_id"], _EMPTY)
+
+    return _NodeListEntry(
+        node["node_id"],
+        node["title"],
+        node["description"],
+        node["difficulty"],
+        node["estimated_duration"],
+        prerequisites,
+        # Locked until every prerequisite is completed
+        not completed_nodes.issuperset(prerequisites),
+        node_progress_data.get("status", "not_started"),
+        node_progress_data.get("completion_percentage", 0),
+    )
+
 
 @router.get("", response_model=dict)
 async def get_nodes(
+    request: Request,
     category: Optional[str] = Query(None),
     difficulty: Optional[str] = Query(None),
     user_id: str = Depends(get_current_user_id),
@@ -23,80 +96,68 @@ async def get_nodes(
     if difficulty:
         query["difficulty"] = difficulty
 
-    # Get nodes
-    nodes_cursor = db.learning_nodes.find(query)
-    nodes = await nodes_cursor.to_list(length=100)
+    # Get nodes and user progress concurrently
+    nodes, progress = await asyncio.gather(
+        db.learning_nodes.find(query, NODE_LIST_PROJECTION).to_list(length=100),
+        db.progress_state.find_one(
+            {"user_id": user_id},
+            {"_id": 0, "completed_nodes": 1, "node_progress": 1}
+        )
+    )
 
-    # Get user progress
-    progress = await db.progress_state.find_one({"user_id": user_id})
+    completed_nodes = frozenset(progress.get("completed_nodes", ())) if progress else frozenset()
+    node_progress_map = progress.get("node_progress", _EMPTY) if progress else _EMPTY
 
     # Build response
-    node_list = []
-    for node in nodes:
-        node_id = node["node_id"]
-
-        # Check if locked
-        prerequisites = node.get("prerequisites", [])
-        completed_nodes = progress.get("completed_nodes", []) if progress else []
-        locked = not all(prereq in completed_nodes for prereq in prerequisites)
-
-        # Get progress
-        node_progress_data = {}
-        if progress:
-            node_progress_data = progress.get("node_progress", {}).get(node_id, {})
-
-        node_item = {
-            "node_id": node_id,
-            "title": node["title"],
-            "description": node["description"],
-            "difficulty": node["difficulty"],
-            "estimated_duration": node["estimated_duration"],
-            "prerequisites": prerequisites,
-            "locked": locked,
-            "completion_status": node_progress_data.get("status", "not_started"),
-            "completion_percentage": node_progress_data.get("completion_percentage", 0)
-        }
-        node_list.append(node_item)
+    node_list = [_node_list_item(node, completed_nodes, node_progress_map) for node in nodes]
 
-    return {"nodes": node_list}
+    return json_with_etag(request, {"nodes": node_list}, NODE_CACHE_CONTROL)
 
 
 @router.get("/{node_id}", response_model=dict)
 async def get_node_detail(
+    request: Request,
     node_id: str,
     user_id: str = Depends(get_current_user_id),
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Get detailed node information with exercises"""
 
-    # Get node
-    node = await db.learning_nodes.find_one({"node_id": node_id})
+    # Get node, its exercises and user progress concurrently
+    node, exercises, progress = await asyncio.gather(
+        db.learning_nodes.find_one({"node_id": node_id}, NODE_DETAIL_PROJECTION),
+        db.exercises.find(
+            {"node_id": node_id},
+            {"_id": 0, "exercise_id": 1, "title": 1, "difficulty": 1}
+        ).to_list(length=100),
+        # Only this node's entry of the user's progress map
+        db.progress_state.find_one(
+            {"user_id": user_id},
+            {f"node_progress.{node_id}": 1}
+        )
+    )
     if not node:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Node not found"
         )
 
-    # Get exercises for this node
-    exercises_cursor = db.exercises.find({"node_id": node_id})
-    exercises = await exercises_cursor.to_list(length=100)
-
-    # Get user progress
-    progress = await db.progress_state.find_one({"user_id": user_id})
     node_progress_data = {}
     if progress:
         node_progress_data = progress.get("node_progress", {}).get(node_id, {})
 
-    # Get completed exercises
+    # Get completed exercises: only the distinct passing exercise ids come back
     completed_exercise_ids = set()
-    if progress:
-        attempts_cursor = db.exercise_attempts.find({
-            "user_id": user_id,
-            "exercise_id": {"$in": [ex["exercise_id"] for ex in exercises]},
-            "score": {"$gte": 70}  # Passing score
-        })
-        completed_attempts = await attempts_cursor.to_list(length=1000)
-        completed_exercise_ids = {att["exercise_id"] for att in completed_attempts}
+    if progress and exercises:
+        async for group in db.exercise_attempts.aggregate([
+            {"$match": {
+                "user_id": user_id,
+                "exercise_id": {"$in": [ex["exercise_id"] for ex in exercises]},
+                "score": {"$gte": 70}  # Passing score
+            }},
+            {"$group": {"_id": "$exercise_id"}}
+        ]):
+            completed_exercise_ids.add(group["_id"])
 
     # Build exercise list
     exercise_list = []
@@ -109,7 +170,7 @@ async def get_node_detail(
         })
 
     # Build response
-    return {
+    return json_with_etag(request, {
         "node": {
             "node_id": node["node_id"],
             "title": node["title"],
@@ -126,7 +187,7 @@ async def get_node_detail(
             "exercises_completed": len(completed_exercise_ids),
             "exercises_total": len(exercises)
         }
-    }
+    }, NODE_CACHE_CONTROL)
 
 
 @router.post("/{node_id}/start", response_model=dict)
@@ -137,31 +198,32 @@ async def start_node(
 ):
     """Start a learning node"""
 
-    # Verify node exists
-    node = await db.learning_nodes.find_one({"node_id": node_id})
+    # Verify node exists and look up its first exercise concurrently
+    node, first_exercise = await asyncio.gather(
+        db.learning_nodes.find_one({"node_id": node_id}, {"_id": 0, "title": 1}),
+        db.exercises.find_one({"node_id": node_id}, {"_id": 0, "exercise_id": 1})
+    )
     if not node:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Node not found"
         )
 
-    # Update progress
-    from datetime import datetime
-    await db.progress_state.update_one(
+    # Update progress; queued and written in a batch by the progress writer
+    from datetime import datetime, timezone
+    now = datetime.now(timezone.utc)
+    progress_writer.enqueue(UpdateOne(
         {"user_id": user_id},
         {
             "$set": {
                 "current_node_id": node_id,
                 f"node_progress.{node_id}.status": "in_progress",
-                f"node_progress.{node_id}.last_accessed": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
+                f"node_progress.{node_id}.last_accessed": now,
+                "updated_at": now
             }
         },
         upsert=True
-    )
-
-    # Get first exercise
-    first_exercise = await db.exercises.find_one({"node_id": node_id})
+    ))
 
     return {
         "message": "Node started",
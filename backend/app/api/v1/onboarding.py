@@ -1,15 +1,22 @@
 """
 Onboarding API endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional, Set, Tuple
 from bson import ObjectId
+import asyncio
+import logging
+import re
+import orjson
 
 from app.dependencies import get_db, get_current_user_id
 from app.ai.agents.tutor_agent import TutorAgent
-from app.ai.prompts.system_prompts import get_system_prompt
+from app.ai.dependencies import get_tutor
+from app.services.user_context_cache import invalidate_user_context_for_ai
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/onboarding", tags=["onboarding"])
 
@@ -38,62 +45,130 @@ class LearningPathResponse(BaseModel):
     settings: dict
 
 
+# Static, so the response body is encoded once at import
+ASSESSMENT_QUESTIONS = [
+    {
+        "question": "What's your experience with programming?",
+        "options": [
+            "Complete beginner - I've never written code",
+            "Some experience - I've done basic tutorials",
+            "Intermediate - I can write simple programs",
+            "Advanced - I'm comfortable with multiple languages",
+        ],
+        "category": "experience",
+    },
+    {
+        "question": "Have you worked with DevOps tools before?",
+        "options": [
+            "Never heard of DevOps",
+            "I know what it is but haven't used tools",
+            "I've used a few tools (Docker, Git, etc.)",
+            "I have professional DevOps experience",
+        ],
+        "category": "technical",
+    },
+    {
+        "question": "What's your primary goal?",
+        "options": [
+            "Learn programming from scratch",
+            "Understand DevOps concepts and tools",
+            "Prepare for a DevOps role",
+            "Improve existing DevOps skills",
+        ],
+        "category": "goals",
+    },
+    {
+        "question": "How do you learn best?",
+        "options": [
+            "Step-by-step with lots of practice",
+            "Quick explanations, then hands-on",
+            "Deep dives with detailed theory",
+            "Real-world projects and challenges",
+        ],
+        "category": "learning_style",
+    },
+    {
+        "question": "How much time can you dedicate per week?",
+        "options": [
+            "1-2 hours (slow and steady)",
+            "3-5 hours (consistent progress)",
+            "6-10 hours (focused learning)",
+            "10+ hours (intensive bootcamp style)",
+        ],
+        "category": "time_commitment",
+    },
+]
+
+_QUESTIONS_BODY = orjson.dumps({"questions": ASSESSMENT_QUESTIONS})
+
+# How long /assess waits for the AI's personalized message before returning a
+# placeholder; the message is still stored for GET /onboarding/message
+PERSONALIZED_MESSAGE_TIMEOUT = 1.5
+PERSONALIZED_MESSAGE_PLACEHOLDER = "Generating your personalized plan..."
+# Stored instead when generation fails, so clients polling /message stop waiting
+PERSONALIZED_MESSAGE_FALLBACK = "Your personalized learning path is ready. Let's get started!"
+
+# Message generations still running after their request returned
+_pending_messages: Set[asyncio.Task] = set()
+
+
+def _compile_matchers(question_index: int, rules: tuple, fallback, missing) -> tuple:
+    """
+    Compile ((substrings, result), ...) rules into one case-insensitive regex
+
+    Each rule is a lookahead alternative anchored at the start, so the regex
+    engine tries rules in order and the first rule with any substring anywhere
+    in the answer wins; match.lastindex then identifies that rule.
+    """
+    pattern = "|".join(
+        "(?=.*?(" + "|".join(re.escape(sub) for sub in substrings) + "))"
+        for substrings, _ in rules
+    )
+    results = tuple(result for _, result in rules)
+    return question_index, re.compile(pattern, re.IGNORECASE | re.DOTALL), results, fallback, missing
+
+
+# Answer matchers: `fallback` is used when no rule matches and `missing` when
+# the question wasn't answered.
+_EXPERIENCE_MATCHERS = _compile_matchers(0, (
+    (("complete beginner", "never written"), "beginner"),
+    (("advanced", "multiple languages"), "advanced"),
+), "intermediate", "beginner")
+
+_PACE_MATCHERS = _compile_matchers(4, (
+    (("1-2 hours",), "slow"),
+    (("10+ hours", "intensive"), "fast"),
+), "medium", "medium")
+
+_FOCUS_MATCHERS = _compile_matchers(2, (
+    (("from scratch",), "programming_basics"),
+    (("devops concepts",), "devops_fundamentals"),
+    (("devops role",), "job_preparation"),
+), "skill_improvement", "general")
+
+_LEARNING_STYLE_MATCHERS = _compile_matchers(3, (
+    (("step-by-step", "practice"), "hands_on_incremental"),
+    (("quick",), "fast_paced"),
+    (("deep", "theory"), "theoretical_comprehensive"),
+    (("real-world", "projects"), "project_based"),
+), "balanced", "balanced")
+
+_TIME_COMMITMENT_MATCHERS = _compile_matchers(4, (
+    (("1-2 hours",), 2),
+    (("3-5 hours",), 4),
+    (("6-10 hours",), 8),
+    (("10+",), 15),
+), 5, 5)
+
+
 @router.get("/questions")
 async def get_assessment_questions():
     """Get onboarding assessment questions"""
-    questions = [
-        {
-            "question": "What's your experience with programming?",
-            "options": [
-                "Complete beginner - I've never written code",
-                "Some experience - I've done basic tutorials",
-                "Intermediate - I can write simple programs",
-                "Advanced - I'm comfortable with multiple languages",
-            ],
-            "category": "experience",
-        },
-        {
-            "question": "Have you worked with DevOps tools before?",
-            "options": [
-                "Never heard of DevOps",
-                "I know what it is but haven't used tools",
-                "I've used a few tools (Docker, Git, etc.)",
-                "I have professional DevOps experience",
-            ],
-            "category": "technical",
-        },
-        {
-            "question": "What's your primary goal?",
-            "options": [
-                "Learn programming from scratch",
-                "Understand DevOps concepts and tools",
-                "Prepare for a DevOps role",
-                "Improve existing DevOps skills",
-            ],
-            "category": "goals",
-        },
-        {
-            "question": "How do you learn best?",
-            "options": [
-                "Step-by-step with lots of practice",
-                "Quick explanations, then hands-on",
-                "Deep dives with detailed theory",
-                "Real-world projects and challenges",
-            ],
-            "category": "learning_style",
-        },
-        {
-            "question": "How much time can you dedicate per week?",
-            "options": [
-                "1-2 hours (slow and steady)",
-                "3-5 hours (consistent progress)",
-                "6-10 hours (focused learning)",
-                "10+ hours (intensive bootcamp style)",
-            ],
-            "category": "time_commitment",
-        },
-    ]
-    return {"questions": questions}
+    return Response(
+        content=_QUESTIONS_BODY,
+        media_type="application/json",
+        headers={"Cache-Control": "public, max-age=86400"},
+    )
 
 
 @router.post("/assess", response_model=LearningPathResponse)
@@ -101,29 +176,46 @@ async def submit_assessment(
     submission: AssessmentSubmission,
     user_id: str = Depends(get_current_user_id),
     db: AsyncIOMotorDatabase = Depends(get_db),
+    tutor: TutorAgent = Depends(get_tutor),
 ):
     """Submit assessment answers and get personalized learning path"""
 
+    # Index answers once; the helpers below look up by question index
+    answers_by_idx, assessment_summary = _index_answers(submission.answers)
+
     # Analyze answers
-    experience_level = _determine_experience_level(submission.answers)
-    learning_pace = _determine_learning_pace(submission.answers)
-    focus_area = _determine_focus_area(submission.answers)
+    experience_level = _determine_experience_level(answers_by_idx)
+    learning_pace = _determine_learning_pace(answers_by_idx)
+    focus_area = _determine_focus_area(answers_by_idx)
+
+    # Clear the previous run's message so GET /onboarding/message doesn't
+    # report it as ready, and tag this run; a generation still running for an
+    # earlier assessment no longer matches the tag and can't store its text
+    message_run_id = str(ObjectId())
+    await db.users.update_one(
+        {"_id": ObjectId(user_id)},
+        {
+            "$set": {"personalized_message_run": message_run_id},
+            "$unset": {"personalized_message": ""},
+        },
+    )
+
+    # Generate personalized message with AI, overlapping the database work below
+    message_task = asyncio.create_task(_generate_personalized_message(
+        tutor,
+        db,
+        user_id,
+        message_run_id,
+        f"Based on this assessment: {assessment_summary}\nGoals: {submission.free_text_goals or 'General DevOps learning'}\nProvide a brief, encouraging personalized message (2-3 sentences) about their learning journey.",
+    ))
+    _pending_messages.add(message_task)
+    message_task.add_done_callback(_forget_message_task)
 
     # Get recommended nodes based on assessment
     recommended_nodes = await _get_recommended_nodes(
         db, experience_level, focus_area
     )
 
-    # Generate personalized message with AI
-    tutor = TutorAgent(db)
-    assessment_summary = _summarize_assessment(submission.answers)
-
-    ai_response = await tutor.ask_question(
-        user_id=user_id,
-        question=f"Based on this assessment: {assessment_summary}\nGoals: {submission.free_text_goals or 'General DevOps learning'}\nProvide a brief, encouraging personalized message (2-3 sentences) about their learning journey.",
-        context_type="onboarding",
-    )
-
     # Determine estimated duration
     duration_weeks = _calculate_duration(experience_level, learning_pace)
 
@@ -135,33 +227,41 @@ async def submit_assessment(
         "focus_mode": False,
     }
 
-    # Update user profile
-    await db.users.update_one(
-        {"_id": ObjectId(user_id)},
-        {
-            "$set": {
-                "onboarding_completed": True,
-                "experience_level": experience_level,
-                "learning_pace": learning_pace,
-                "focus_area": focus_area,
-                "settings": settings,
-            }
-        },
+    # Update user profile, and the copy of pace_preference read by progress stats
+    await asyncio.gather(
+        db.users.update_one(
+            {"_id": ObjectId(user_id)},
+            {
+                "$set": {
+                    "onboarding_completed": True,
+                    "experience_level": experience_level,
+                    "learning_pace": learning_pace,
+                    "focus_area": focus_area,
+                    "settings": settings,
+                }
+            },
+        ),
+        db.progress_state.update_one(
+            {"user_id": user_id},
+            {"$set": {"pace_preference": learning_pace}},
+            upsert=True,
+        ),
     )
 
     # Create initial user context from assessment
-    from datetime import datetime
+    from datetime import datetime, timezone
+    now = datetime.now(timezone.utc)
 
     initial_context = {
         "user_id": user_id,
         "learning": {
             "learning_motivation": focus_area,
-            "preferred_learning_style": _get_learning_style_from_answers(answers),
-            "available_time_per_week": _get_time_commitment_from_answers(answers),
+            "preferred_learning_style": _get_learning_style_from_answers(answers_by_idx),
+            "available_time_per_week": _get_time_commitment_from_answers(answers_by_idx),
         },
         "free_text_notes": submission.free_text_goals or "",
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
+        "created_at": now,
+        "updated_at": now
     }
 
     # Check if context already exists
@@ -176,66 +276,119 @@ async def submit_assessment(
                 "$set": {
                     "learning": initial_context["learning"],
                     "free_text_notes": initial_context["free_text_notes"],
-                    "updated_at": datetime.utcnow()
+                    "updated_at": now
                 }
             }
         )
+    await invalidate_user_context_for_ai(user_id)
+
+    # Cap how long onboarding waits on the model; a slow reply keeps running
+    # in the background and is picked up from GET /onboarding/message
+    try:
+        personalized_message = await asyncio.wait_for(
+            asyncio.shield(message_task), timeout=PERSONALIZED_MESSAGE_TIMEOUT
+        )
+    except Exception:
+        # Timed out, or failed (the task logs failures); the profile, progress
+        # and context are already written, so onboarding still succeeds
+        personalized_message = PERSONALIZED_MESSAGE_PLACEHOLDER
 
     return LearningPathResponse(
         recommended_level=experience_level,
-        starting_nodes=[str(node["_id"]) for node in recommended_nodes],
+        starting_nodes=[node["node_id"] for node in recommended_nodes],
         estimated_duration_weeks=duration_weeks,
-        personalized_message=ai_response["message"],
+        personalized_message=personalized_message,
         settings=settings,
     )
 
 
-def _determine_experience_level(answers: List[AssessmentAnswer]) -> str:
+@router.get("/message")
+async def get_personalized_message(
+    user_id: str = Depends(get_current_user_id),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """Get the AI's personalized onboarding message, once it has been generated"""
+    user = await db.users.find_one(
+        {"_id": ObjectId(user_id)}, {"_id": 0, "personalized_message": 1}
+    )
+    message = user.get("personalized_message") if user else None
+    return {"ready": message is not None, "personalized_message": message}
+
+
+def _forget_message_task(task: asyncio.Task):
+    """Drop a finished generation; failures were already logged"""
+    _pending_messages.discard(task)
+    if not task.cancelled():
+        task.exception()
+
+
+async def _generate_personalized_message(
+    tutor: TutorAgent, db: AsyncIOMotorDatabase, user_id: str, run_id: str, question: str
+) -> str:
+    """
+    Ask the tutor for the onboarding message and store it on the user
+
+    Only stored while run_id is still the user's latest assessment. On failure
+    the fallback message is stored instead, so pollers get an answer.
+    """
+    try:
+        ai_response = await tutor.ask_question(
+            user_id=user_id,
+            question=question,
+            context_type="onboarding",
+        )
+        message = ai_response["message"]
+    except Exception:
+        logger.exception("❌ Failed to generate personalized message for user %s", user_id)
+        message = PERSONALIZED_MESSAGE_FALLBACK
+
+    try:
+        await db.users.update_one(
+            {"_id": ObjectId(user_id), "personalized_message_run": run_id},
+            {"$set": {"personalized_message": message}},
+        )
+    except Exception:
+        logger.exception("❌ Failed to store personalized message for user %s", user_id)
+        raise
+    return message
+
+
+def _index_answers(answers: List[AssessmentAnswer]) -> Tuple[Dict[int, str], str]:
+    """
+    Index answers by question and summarise them for the AI in one pass
+    """
+    answers_by_idx = {}
+    summary_parts = []
+    for answer in answers:
+        answers_by_idx[answer.question_index] = answer.answer
+        summary_parts.append(f"Q{answer.question_index + 1}: {answer.answer}")
+    return answers_by_idx, " | ".join(summary_parts)
+
+
+def _match_answer(answers_by_idx: Dict[int, str], matchers: tuple):
+    """Classify one answer using a compiled module-level matcher"""
+    question_index, regex, results, fallback, missing = matchers
+    answer = answers_by_idx.get(question_index)
+    if answer is None:
+        return missing
+
+    match = regex.match(answer)
+    return results[match.lastindex - 1] if match else fallback
+
+
+def _determine_experience_level(answers_by_idx: Dict[int, str]) -> str:
     """Determine user's experience level from answers"""
-    # Find programming experience answer
-    prog_answer = next((a for a in answers if a.question_index == 0), None)
-    if not prog_answer:
-        return "beginner"
-
-    answer_lower = prog_answer.answer.lower()
-    if "complete beginner" in answer_lower or "never written" in answer_lower:
-        return "beginner"
-    elif "advanced" in answer_lower or "multiple languages" in answer_lower:
-        return "advanced"
-    else:
-        return "intermediate"
+    return _match_answer(answers_by_idx, _EXPERIENCE_MATCHERS)
 
 
-def _determine_learning_pace(answers: List[AssessmentAnswer]) -> str:
+def _determine_learning_pace(answers_by_idx: Dict[int, str]) -> str:
     """Determine preferred learning pace"""
-    time_answer = next((a for a in answers if a.question_index == 4), None)
-    if not time_answer:
-        return "medium"
-
-    answer_lower = time_answer.answer.lower()
-    if "1-2 hours" in answer_lower:
-        return "slow"
-    elif "10+ hours" in answer_lower or "intensive" in answer_lower:
-        return "fast"
-    else:
-        return "medium"
+    return _match_answer(answers_by_idx, _PACE_MATCHERS)
 
 
-def _determine_focus_area(answers: List[AssessmentAnswer]) -> str:
+def _determine_focus_area(answers_by_idx: Dict[int, str]) -> str:
     """Determine user's primary focus area"""
-    goal_answer = next((a for a in answers if a.question_index == 2), None)
-    if not goal_answer:
-        return "general"
-
-    answer_lower = goal_answer.answer.lower()
-    if "from scratch" in answer_lower:
-        return "programming_basics"
-    elif "devops concepts" in answer_lower:
-        return "devops_fundamentals"
-    elif "devops role" in answer_lower:
-        return "job_preparation"
-    else:
-        return "skill_improvement"
+    return _match_answer(answers_by_idx, _FOCUS_MATCHERS)
 
 
 async def _get_recommended_nodes(
@@ -254,11 +407,16 @@ async def _get_recommended_nodes(
         query["difficulty"] = {"$in": ["intermediate", "advanced"]}
 
     # Get nodes matching criteria
-    nodes = await db.nodes.find(query).limit(3).to_list(length=3)
+    # Only the ids are returned to the client
+    nodes = await db.learning_nodes.find(
+        query, {"_id": 0, "node_id": 1}
+    ).limit(3).to_list(length=3)
 
     # If not enough nodes, get any beginner nodes
     if len(nodes) < 2:
-        nodes = await db.nodes.find({"difficulty": "beginner"}).limit(3).to_list(length=3)
+        nodes = await db.learning_nodes.find(
+            {"difficulty": "beginner"}, {"_id": 0, "node_id": 1}
+        ).limit(3).to_list(length=3)
 
     return nodes
 
@@ -283,49 +441,11 @@ def _calculate_duration(experience_level: str, learning_pace: str) -> int:
     return int(duration)
 
 
-def _summarize_assessment(answers: List[AssessmentAnswer]) -> str:
-    """Create a summary of assessment answers for AI"""
-    summary_parts = []
-    for answer in answers:
-        summary_parts.append(f"Q{answer.question_index + 1}: {answer.answer}")
-    return " | ".join(summary_parts)
-
-
-def _get_learning_style_from_answers(answers: List[AssessmentAnswer]) -> str:
+def _get_learning_style_from_answers(answers_by_idx: Dict[int, str]) -> str:
     """Extract learning style from assessment answers"""
-    # Find learning style answer (question index 3)
-    style_answer = next((a for a in answers if a.question_index == 3), None)
-    if not style_answer:
-        return "balanced"
-
-    answer_lower = style_answer.answer.lower()
-    if "step-by-step" in answer_lower or "practice" in answer_lower:
-        return "hands_on_incremental"
-    elif "quick" in answer_lower:
-        return "fast_paced"
-    elif "deep" in answer_lower or "theory" in answer_lower:
-        return "theoretical_comprehensive"
-    elif "real-world" in answer_lower or "projects" in answer_lower:
-        return "project_based"
-    else:
-        return "balanced"
+    return _match_answer(answers_by_idx, _LEARNING_STYLE_MATCHERS)
 
 
-def _get_time_commitment_from_answers(answers: List[AssessmentAnswer]) -> int:
+def _get_time_commitment_from_answers(answers_by_idx: Dict[int, str]) -> int:
     """Extract time commitment from assessment answers"""
-    # Find time commitment answer (question index 4)
-    time_answer = next((a for a in answers if a.question_index == 4), None)
-    if not time_answer:
-        return 5
-
-    answer_lower = time_answer.answer.lower()
-    if "1-2 hours" in answer_lower:
-        return 2
-    elif "3-5 hours" in answer_lower:
-        return 4
-    elif "6-10 hours" in answer_lower:
-        return 8
-    elif "10+" in answer_lower:
-        return 15
-    else:
-        return 5
+    return _match_answer(answers_by_idx, _TIME_COMMITMENT_MATCHERS)
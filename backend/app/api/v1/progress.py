@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from datetime import datetime, timedelta
-from typing import List, Dict
+from redis.asyncio import Redis
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Dict, Tuple
 from bson import ObjectId
-from app.dependencies import get_db, get_current_user_id
+import asyncio
+import orjson
+from app.dependencies import get_db, get_current_user_id, get_redis_client
 from app.models.progress import ProgressResponse, StatsResponse
+from app.services.dashboard_cache import DASHBOARD_CACHE_TTL, dashboard_cache_key
 
 router = APIRouter(prefix="/progress", tags=["Progress"])
 
@@ -16,7 +20,17 @@ async def get_progress(
 ):
     """Get user progress"""
 
-    progress = await db.progress_state.find_one({"user_id": user_id})
+    progress = await db.progress_state.find_one(
+        {"user_id": user_id},
+        {
+            "_id": 0,
+            "current_node_id": 1,
+            "completed_nodes": 1,
+            "unlocked_nodes": 1,
+            "overall_stats": 1,
+            "node_progress": 1
+        }
+    )
 
     if not progress:
         # Return empty progress
@@ -50,85 +64,114 @@ async def get_stats(
 ):
     """Get detailed user statistics"""
 
-    # Get user memory (weaknesses and strengths)
-    memory_cursor = db.user_memory.find({"user_id": user_id})
-    memories = await memory_cursor.to_list(length=100)
-
-    strengths = []
-    weaknesses = []
-
-    for mem in memories:
-        if mem["memory_type"] == "strength":
-            strengths.append({
-                "concept": mem["concept"],
-                "proficiency": 100 - (mem.get("severity", 1) * 10)
-            })
-        elif mem["memory_type"] in ["weakness", "confusion"]:
-            weaknesses.append({
-                "concept": mem["concept"],
-                "confusion_count": mem.get("frequency", 1)
-            })
+    # Get user memory (weaknesses and strengths) and progress concurrently;
+    # pace_preference is kept on progress_state so users needn't be read
+    (strengths, weaknesses), progress = await asyncio.gather(
+        _collect_memories(db, user_id),
+        db.progress_state.find_one({"user_id": user_id}, {"_id": 0, "pace_preference": 1})
+    )
 
     # Get learning patterns
-    progress = await db.progress_state.find_one({"user_id": user_id})
-    settings = {}
+    pace_preference = "medium"
     if progress:
-        user = await db.users.find_one({"_id": user_id})
-        if user:
-            settings = user.get("settings", {})
+        pace_preference = progress.get("pace_preference")
+        if pace_preference is None:
+            # Progress written before pace_preference was copied onto it
+            user = await db.users.find_one(
+                {"_id": ObjectId(user_id)}, {"_id": 0, "settings.pace_preference": 1}
+            )
+            pace_preference = ((user or {}).get("settings") or {}).get("pace_preference", "medium")
 
     learning_patterns = {
         "best_time_of_day": None,  # TODO: Calculate from activity logs
         "average_session_length": 45,  # TODO: Calculate from sessions
-        "preferred_pace": settings.get("pace_preference", "medium")
+        "preferred_pace": pace_preference
     }
 
     return {
-        "strengths": strengths[:10],  # Top 10
-        "weaknesses": weaknesses[:10],  # Top 10
+        "strengths": strengths,  # Top 10
+        "weaknesses": weaknesses,  # Top 10
         "learning_patterns": learning_patterns
     }
 
 
+# Strengths and weaknesses shown by the stats endpoint, each
+MEMORY_LIMIT = 10
+
+
+async def _collect_memories(db: AsyncIOMotorDatabase, user_id: str) -> Tuple[List[Dict], List[Dict]]:
+    """Stream the user's memories until the first MEMORY_LIMIT of each kind are found"""
+    strengths = []
+    weaknesses = []
+
+    cursor = db.user_memory.find(
+        {"user_id": user_id, "memory_type": {"$in": ["strength", "weakness", "confusion"]}},
+        {"_id": 0, "memory_type": 1, "concept": 1, "severity": 1, "frequency": 1}
+    )
+    async for mem in cursor:
+        if mem["memory_type"] == "strength":
+            if len(strengths) < MEMORY_LIMIT:
+                strengths.append({
+                    "concept": mem["concept"],
+                    "proficiency": 100 - (mem.get("severity", 1) * 10)
+                })
+        elif len(weaknesses) < MEMORY_LIMIT:
+            weaknesses.append({
+                "concept": mem["concept"],
+                "confusion_count": mem.get("frequency", 1)
+            })
+
+        if len(strengths) >= MEMORY_LIMIT and len(weaknesses) >= MEMORY_LIMIT:
+            break
+
+    await cursor.close()
+    return strengths, weaknesses
+
+
 @router.get("/dashboard", response_model=dict)
 async def get_dashboard_stats(
     user_id: str = Depends(get_current_user_id),
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    redis: Redis = Depends(get_redis_client)
 ):
     """Get comprehensive dashboard statistics"""
 
-    # Get all user attempts
-    attempts = await db.attempts.find({"user_id": user_id}).to_list(length=1000)
-
-    # Calculate overall stats
-    total_attempts = len(attempts)
-    passed_attempts = len([a for a in attempts if a.get("score", 0) >= 70])
+    # Serve the stored JSON as-is until it expires or an attempt invalidates it
+    cache_key = dashboard_cache_key(user_id)
+    cached = await redis.get(cache_key)
+    if cached:
+        return Response(content=cached, media_type="application/json")
+
+    # Overview, streak, weekly activity and difficulty breakdown come from one
+    # aggregation; recent nodes are independent, so both run concurrently
+    now = datetime.now(timezone.utc)
+    # Calendar day in UTC, comparable with the dates of the $dateTrunc buckets
+    today = now.date()
+    week_start = datetime.combine(today - timedelta(days=6), datetime.min.time(), tzinfo=timezone.utc)
+    stats, recent_nodes = await asyncio.gather(
+        _aggregate_attempt_stats(db, user_id, week_start),
+        _get_completed_nodes(db, user_id)
+    )
+
+    total_attempts = stats["total"]
+    passed_attempts = stats["passed"]
     success_rate = (passed_attempts / total_attempts * 100) if total_attempts > 0 else 0
 
-    # Get unique exercises completed
-    completed_exercises = set()
-    for attempt in attempts:
-        if attempt.get("score", 0) >= 70:
-            completed_exercises.add(attempt["exercise_id"])
-
     # Calculate streak
-    streak_days = await _calculate_streak(db, user_id)
+    streak_days = _calculate_streak(stats["active_days"], today)
 
     # Get progress by difficulty
-    exercises_by_difficulty = await _get_exercises_by_difficulty(db, attempts)
+    exercises_by_difficulty = stats["by_difficulty"]
 
     # Get weekly activity (last 7 days)
-    weekly_activity = await _get_weekly_activity(db, user_id)
-
-    # Get recent achievements
-    recent_nodes = await _get_completed_nodes(db, user_id)
+    weekly_activity = _fill_weekly_activity(today, stats["weekly"])
 
     # Time spent (estimated from attempts)
-    total_time_minutes = len(attempts) * 15  # Rough estimate: 15 min per attempt
+    total_time_minutes = total_attempts * 15  # Rough estimate: 15 min per attempt
 
-    return {
+    dashboard = {
         "overview": {
-            "exercises_completed": len(completed_exercises),
+            "exercises_completed": stats["completed_count"],
             "total_attempts": total_attempts,
             "success_rate": round(success_rate, 1),
             "streak_days": streak_days,
@@ -140,75 +183,113 @@ async def get_dashboard_stats(
         "recent_nodes": recent_nodes[:5],
     }
 
+    body = orjson.dumps(dashboard)
+    await redis.set(cache_key, body, ex=DASHBOARD_CACHE_TTL)
+    return Response(content=body, media_type="application/json")
 
-async def _calculate_streak(db: AsyncIOMotorDatabase, user_id: str) -> int:
-    """Calculate current learning streak in days"""
-    # Get attempts sorted by date
-    attempts = await db.attempts.find({"user_id": user_id}).sort("created_at", -1).to_list(length=100)
 
-    if not attempts:
-        return 0
+# Longest streak reported, in days
+MAX_STREAK_DAYS = 365
 
-    # Check consecutive days
-    streak = 0
-    current_date = datetime.utcnow().date()
 
-    for attempt in attempts:
-        attempt_date = attempt.get("created_at", datetime.utcnow()).date()
+def _calculate_streak(active_days: List[date], today: date) -> int:
+    """Count consecutive active days ending today or yesterday (active_days newest first)"""
+    if not active_days or today - active_days[0] > timedelta(days=1):
+        return 0
 
-        # Check if this attempt is within the streak
-        if attempt_date == current_date or attempt_date == current_date - timedelta(days=1):
-            streak += 1
-            current_date = attempt_date - timedelta(days=1)
-        else:
+    streak = 1
+    for prev, cur in zip(active_days, active_days[1:]):
+        if prev - cur != timedelta(days=1):
             break
+        streak += 1
+
+    return min(streak, MAX_STREAK_DAYS)
+
+
+# Score an attempt needs to count as passed
+PASSING_SCORE = 70
+
+_IS_PASSED = {"$gte": ["$score", PASSING_SCORE]}
+
+
+async def _aggregate_attempt_stats(db: AsyncIOMotorDatabase, user_id: str, week_start: datetime) -> Dict:
+    """Compute the dashboard's attempt counts server-side with a single $facet pipeline"""
+    pipeline = [
+        {"$match": {"user_id": user_id}},
+        # Keep documents small before they're fanned out to every facet
+        {"$project": {"_id": 0, "submitted_at": 1, "score": 1, "exercise_id": 1, "difficulty": 1}},
+        {"$facet": {
+            "overview": [
+                {"$group": {
+                    "_id": None,
+                    "total": {"$sum": 1},
+                    "passed": {"$sum": {"$cond": [_IS_PASSED, 1, 0]}},
+                    "completed_set": {"$addToSet": {"$cond": [_IS_PASSED, "$exercise_id", "$$REMOVE"]}},
+                }},
+                # Only the number of distinct passed exercises is shown
+                {"$project": {
+                    "_id": 0,
+                    "total": 1,
+                    "passed": 1,
+                    "completed_count": {"$size": "$completed_set"},
+                }},
+            ],
+            "weekly": [
+                {"$match": {"submitted_at": {"$gte": week_start}}},
+                {"$group": {
+                    "_id": {"$dateTrunc": {"date": "$submitted_at", "unit": "day"}},
+                    "count": {"$sum": 1},
+                }},
+            ],
+            # Distinct active days, newest first, for the streak walk
+            "active_days": [
+                {"$group": {"_id": {"$dateTrunc": {"date": "$submitted_at", "unit": "day"}}}},
+                {"$sort": {"_id": -1}},
+                {"$limit": MAX_STREAK_DAYS},
+            ],
+            # difficulty is copied onto each attempt when it's created
+            "by_difficulty": [
+                {"$group": {
+                    "_id": {"$ifNull": ["$difficulty", "beginner"]},
+                    "total": {"$sum": 1},
+                    "completed": {"$sum": {"$cond": [_IS_PASSED, 1, 0]}},
+                }},
+            ],
+        }},
+    ]
 
-    return min(streak, 365)  # Cap at 365 days
+    result = (await db.exercise_attempts.aggregate(pipeline).to_list(length=1))[0]
 
+    overview = result["overview"][0] if result["overview"] else {}
 
-async def _get_exercises_by_difficulty(db: AsyncIOMotorDatabase, attempts: List[Dict]) -> Dict:
-    """Get exercise completion by difficulty level"""
     difficulty_stats = {
         "beginner": {"completed": 0, "total": 0},
         "intermediate": {"completed": 0, "total": 0},
         "advanced": {"completed": 0, "total": 0},
     }
+    for row in result["by_difficulty"]:
+        if row["_id"] in difficulty_stats:
+            difficulty_stats[row["_id"]] = {"completed": row["completed"], "total": row["total"]}
 
-    # Get exercise details for all attempts
-    exercise_ids = list(set(a["exercise_id"] for a in attempts))
-    exercises = await db.exercises.find({"_id": {"$in": [ObjectId(eid) for eid in exercise_ids]}}).to_list(length=100)
-
-    exercise_difficulty = {str(e["_id"]): e.get("difficulty", "beginner") for e in exercises}
-
-    for attempt in attempts:
-        difficulty = exercise_difficulty.get(attempt["exercise_id"], "beginner")
-        if difficulty in difficulty_stats:
-            difficulty_stats[difficulty]["total"] += 1
-            if attempt.get("score", 0) >= 70:
-                difficulty_stats[difficulty]["completed"] += 1
-
-    return difficulty_stats
+    return {
+        "total": overview.get("total", 0),
+        "passed": overview.get("passed", 0),
+        "completed_count": overview.get("completed_count", 0),
+        "weekly": {row["_id"].date(): row["count"] for row in result["weekly"]},
+        "active_days": [row["_id"].date() for row in result["active_days"] if row["_id"]],
+        "by_difficulty": difficulty_stats,
+    }
 
 
-async def _get_weekly_activity(db: AsyncIOMotorDatabase, user_id: str) -> List[Dict]:
-    """Get activity for last 7 days"""
+def _fill_weekly_activity(today: date, counts_by_day: Dict[date, int]) -> List[Dict]:
+    """Expand per-day counts into the last 7 days, oldest first, with zeros for idle days"""
     activity = []
-    today = datetime.utcnow().date()
-
     for i in range(6, -1, -1):
-        date = today - timedelta(days=i)
-        start = datetime.combine(date, datetime.min.time())
-        end = datetime.combine(date, datetime.max.time())
-
-        count = await db.attempts.count_documents({
-            "user_id": user_id,
-            "created_at": {"$gte": start, "$lte": end}
-        })
-
+        day = today - timedelta(days=i)
         activity.append({
-            "date": date.isoformat(),
-            "day": date.strftime("%a"),
-            "exercises": count
+            "date": day.isoformat(),
+            "day": day.strftime("%a"),
+            "exercises": counts_by_day.get(day, 0)
         })
 
     return activity
@@ -216,18 +297,22 @@ async def _get_weekly_activity(db: AsyncIOMotorDatabase, user_id: str) -> List[D
 
 async def _get_completed_nodes(db: AsyncIOMotorDatabase, user_id: str) -> List[Dict]:
     """Get recently completed nodes"""
-    progress = await db.progress_state.find_one({"user_id": user_id})
+    progress = await db.progress_state.find_one(
+        {"user_id": user_id}, {"_id": 0, "completed_nodes": {"$slice": 5}}
+    )
 
     if not progress or not progress.get("completed_nodes"):
         return []
 
-    # Get node details
-    node_ids = [ObjectId(nid) for nid in progress["completed_nodes"][:5]]
-    nodes = await db.nodes.find({"_id": {"$in": node_ids}}).to_list(length=5)
+    # Get node details; completed_nodes holds learning_nodes node_ids
+    nodes = await db.learning_nodes.find(
+        {"node_id": {"$in": progress["completed_nodes"][:5]}},
+        {"_id": 0, "node_id": 1, "title": 1, "difficulty": 1}
+    ).to_list(length=5)
 
     return [
         {
-            "id": str(node["_id"]),
+            "id": node["node_id"],
             "title": node["title"],
             "difficulty": node["difficulty"],
         }
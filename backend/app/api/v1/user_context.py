@@ -3,7 +3,7 @@ User Context API endpoints - Comprehensive user information management
 """
 from fastapi import APIRouter, Depends, HTTPException, status
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional
 
 from app.dependencies import get_db, get_current_user_id
@@ -16,9 +16,48 @@ from app.models.user_context import (
     CareerGoals,
     PersonalContext
 )
+from app.services.user_context_cache import (
+    cache_user_context_for_ai,
+    get_cached_user_context_for_ai,
+    invalidate_user_context_for_ai
+)
 
 router = APIRouter(prefix="/user-context", tags=["User Context"])
 
+# Sections read back by the context endpoint
+USER_CONTEXT_PROJECTION = {
+    "_id": 0,
+    "education": 1,
+    "work": 1,
+    "learning": 1,
+    "career_goals": 1,
+    "personal": 1,
+    "free_text_notes": 1,
+    "created_at": 1,
+    "updated_at": 1,
+}
+
+# Only the fields the AI summary mentions
+USER_CONTEXT_AI_PROJECTION = {
+    "_id": 0,
+    "education.highest_degree": 1,
+    "education.field_of_study": 1,
+    "education.current_student": 1,
+    "work.current_role": 1,
+    "work.years_of_experience": 1,
+    "work.industry": 1,
+    "work.technical_background": 1,
+    "learning.learning_motivation": 1,
+    "learning.available_time_per_week": 1,
+    "learning.learning_challenges": 1,
+    "career_goals.target_role": 1,
+    "career_goals.timeline": 1,
+    "career_goals.location_preference": 1,
+    "personal.age_range": 1,
+    "personal.native_language": 1,
+    "free_text_notes": 1,
+}
+
 
 @router.get("", response_model=dict)
 async def get_user_context(
@@ -26,7 +65,7 @@ async def get_user_context(
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Get comprehensive user context"""
-    context = await db.user_context.find_one({"user_id": user_id})
+    context = await db.user_context.find_one({"user_id": user_id}, USER_CONTEXT_PROJECTION)
 
     if not context:
         # Return empty context if none exists
@@ -64,37 +103,10 @@ async def update_user_context(
 ):
     """Update user context (creates if doesn't exist)"""
 
-    # Check if context exists
-    existing_context = await db.user_context.find_one({"user_id": user_id})
-
-    # Prepare update data
-    update_data = {}
-    if context_data.education:
-        update_data["education"] = context_data.education.dict(exclude_none=True)
-    if context_data.work:
-        update_data["work"] = context_data.work.dict(exclude_none=True)
-    if context_data.learning:
-        update_data["learning"] = context_data.learning.dict(exclude_none=True)
-    if context_data.career_goals:
-        update_data["career_goals"] = context_data.career_goals.dict(exclude_none=True)
-    if context_data.personal:
-        update_data["personal"] = context_data.personal.dict(exclude_none=True)
-    if context_data.free_text_notes:
-        update_data["free_text_notes"] = context_data.free_text_notes
-
-    update_data["updated_at"] = datetime.utcnow()
-
-    if existing_context:
-        # Update existing context
-        await db.user_context.update_one(
-            {"user_id": user_id},
-            {"$set": update_data}
-        )
-    else:
-        # Create new context
-        update_data["user_id"] = user_id
-        update_data["created_at"] = datetime.utcnow()
-        await db.user_context.insert_one(update_data)
+    # One dump of the whole payload; sections left out of the request are skipped
+    update_data = context_data.model_dump(exclude_none=True)
+
+    await _upsert_context(db, user_id, update_data)
 
     return {
         "message": "User context updated successfully",
@@ -109,17 +121,7 @@ async def update_education(
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Update only education section"""
-    await _ensure_context_exists(db, user_id)
-
-    await db.user_context.update_one(
-        {"user_id": user_id},
-        {
-            "$set": {
-                "education": education.dict(exclude_none=True),
-                "updated_at": datetime.utcnow()
-            }
-        }
-    )
+    await _upsert_context(db, user_id, {"education": education.model_dump(exclude_none=True)})
 
     return {"message": "Education updated successfully"}
 
@@ -131,17 +133,7 @@ async def update_work(
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Update only work experience section"""
-    await _ensure_context_exists(db, user_id)
-
-    await db.user_context.update_one(
-        {"user_id": user_id},
-        {
-            "$set": {
-                "work": work.dict(exclude_none=True),
-                "updated_at": datetime.utcnow()
-            }
-        }
-    )
+    await _upsert_context(db, user_id, {"work": work.model_dump(exclude_none=True)})
 
     return {"message": "Work experience updated successfully"}
 
@@ -153,17 +145,7 @@ async def update_learning(
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Update only learning context section"""
-    await _ensure_context_exists(db, user_id)
-
-    await db.user_context.update_one(
-        {"user_id": user_id},
-        {
-            "$set": {
-                "learning": learning.dict(exclude_none=True),
-                "updated_at": datetime.utcnow()
-            }
-        }
-    )
+    await _upsert_context(db, user_id, {"learning": learning.model_dump(exclude_none=True)})
 
     return {"message": "Learning context updated successfully"}
 
@@ -175,17 +157,7 @@ async def update_career_goals(
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Update only career goals section"""
-    await _ensure_context_exists(db, user_id)
-
-    await db.user_context.update_one(
-        {"user_id": user_id},
-        {
-            "$set": {
-                "career_goals": career_goals.dict(exclude_none=True),
-                "updated_at": datetime.utcnow()
-            }
-        }
-    )
+    await _upsert_context(db, user_id, {"career_goals": career_goals.model_dump(exclude_none=True)})
 
     return {"message": "Career goals updated successfully"}
 
@@ -197,17 +169,7 @@ async def update_personal(
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Update only personal context section"""
-    await _ensure_context_exists(db, user_id)
-
-    await db.user_context.update_one(
-        {"user_id": user_id},
-        {
-            "$set": {
-                "personal": personal.dict(exclude_none=True),
-                "updated_at": datetime.utcnow()
-            }
-        }
-    )
+    await _upsert_context(db, user_id, {"personal": personal.model_dump(exclude_none=True)})
 
     return {"message": "Personal context updated successfully"}
 
@@ -219,42 +181,49 @@ async def add_note(
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Add or update free-text notes"""
-    await _ensure_context_exists(db, user_id)
+    await _upsert_context(db, user_id, {"free_text_notes": note})
+
+    return {"message": "Note added successfully"}
 
+
+async def _upsert_context(db: AsyncIOMotorDatabase, user_id: str, fields: dict):
+    """Set context fields in one round trip, creating the document if it doesn't exist"""
+    now = datetime.now(timezone.utc)
     await db.user_context.update_one(
         {"user_id": user_id},
         {
-            "$set": {
-                "free_text_notes": note,
-                "updated_at": datetime.utcnow()
-            }
-        }
+            "$set": {**fields, "updated_at": now},
+            "$setOnInsert": {"user_id": user_id, "created_at": now}
+        },
+        upsert=True
     )
-
-    return {"message": "Note added successfully"}
-
-
-async def _ensure_context_exists(db: AsyncIOMotorDatabase, user_id: str):
-    """Ensure user context document exists"""
-    existing = await db.user_context.find_one({"user_id": user_id})
-    if not existing:
-        await db.user_context.insert_one({
-            "user_id": user_id,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
-        })
+    await invalidate_user_context_for_ai(user_id)
 
 
 async def get_user_context_for_ai(db: AsyncIOMotorDatabase, user_id: str) -> str:
     """
     Get formatted user context for AI prompts
     Returns a comprehensive summary of user information
+
+    The summary is cached in Redis until the user's context is next written.
     """
-    context = await db.user_context.find_one({"user_id": user_id})
+    cached = await get_cached_user_context_for_ai(user_id)
+    if cached is not None:
+        return cached
+
+    context = await db.user_context.find_one({"user_id": user_id}, USER_CONTEXT_AI_PROJECTION)
 
     if not context:
+        # Not cached: onboarding creates the context moments after first use
         return "No detailed user context available yet."
 
+    summary = _format_user_context(context)
+    await cache_user_context_for_ai(user_id, summary)
+    return summary
+
+
+def _format_user_context(context: dict) -> str:
+    """Summarise a user_context document in one line for the AI"""
     context_parts = []
 
     # Education
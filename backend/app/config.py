@@ -18,6 +18,11 @@ class Settings(BaseSettings):
     # Database
     MONGODB_URL: str = "mongodb://localhost:27017"
     MONGODB_DB_NAME: str = "myteacher"
+    MONGODB_MAX_POOL_SIZE: int = 100
+    MONGODB_MIN_POOL_SIZE: int = 20
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS: int = 2500
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS: int = 3000
+    MONGODB_COMPRESSORS: str = "zstd,zlib"
 
     # Redis
     REDIS_URL: str = "redis://localhost:6379"
@@ -30,11 +35,16 @@ class Settings(BaseSettings):
 
     # AI
     ANTHROPIC_API_KEY: str = ""
+    LLM_MAX_CONCURRENCY: int = 64  # in-flight Claude requests per process
 
     # Sandbox
+    SANDBOX_BACKEND: str = "subprocess"  # "subprocess" or "docker"
     SANDBOX_TIMEOUT: int = 30  # seconds
     SANDBOX_MEMORY_LIMIT: str = "256m"
     SANDBOX_CPU_LIMIT: str = "0.5"
+    SANDBOX_PIDS_LIMIT: int = 64  # processes per sandbox container (docker backend)
+    SANDBOX_POOL_SIZE: int = 2  # warm containers per language, split across workers (docker backend)
+    SANDBOX_CONTAINER_MAX_USES: int = 50  # runs before a container is replaced
     MAX_CODE_LENGTH: int = 10000
     MAX_OUTPUT_SIZE: int = 10240  # 10KB
 
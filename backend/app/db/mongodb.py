@@ -1,8 +1,52 @@
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo.errors import OperationFailure
 from app.config import get_settings
 
 settings = get_settings()
 
+# (collection, keys, options) for indexes backing the hot query paths
+INDEXES = [
+    (
+        "chat_sessions",
+        [("user_id", 1), ("context_type", 1), ("is_active", 1), ("context_id", 1)],
+        {},
+    ),
+    ("chat_sessions", [("user_id", 1), ("updated_at", -1)], {}),
+    ("chat_messages", [("session_id", 1), ("created_at", -1)], {}),
+    ("user_progress", [("user_id", 1), ("node_id", 1)], {"unique": True}),
+    (
+        "exercise_attempts",
+        [("user_id", 1), ("exercise_id", 1), ("submitted_at", -1)],
+        {},
+    ),
+    # Covers the distinct passing-exercise lookup in node detail
+    ("exercise_attempts", [("user_id", 1), ("exercise_id", 1), ("score", 1)], {}),
+    # Dashboard aggregations match attempts by user and bucket them by day
+    ("exercise_attempts", [("user_id", 1), ("submitted_at", 1)], {}),
+    ("exercises", [("exercise_id", 1)], {"unique": True}),
+    ("exercises", [("node_id", 1)], {}),
+    ("users", [("email", 1)], {"unique": True}),
+    ("progress_state", [("user_id", 1)], {"unique": True}),
+    ("learning_nodes", [("node_id", 1)], {"unique": True}),
+    ("learning_nodes", [("category", 1), ("difficulty", 1)], {}),
+    # Onboarding recommendations filter nodes by difficulty alone
+    ("learning_nodes", [("difficulty", 1)], {}),
+    ("user_memory", [("user_id", 1), ("memory_type", 1)], {}),
+    ("user_context", [("user_id", 1)], {"unique": True}),
+    (
+        "learning_content",
+        [("content_id", 1), ("created_for_user", 1)],
+        {"unique": True},
+    ),
+]
+
+# Unique indexes the code relies on for correctness rather than speed;
+# registration rejects duplicate emails only through users.email, so
+# startup fails if these can't be built
+REQUIRED_INDEXES = [
+    ("users", [("email", 1)]),
+]
+
 
 class MongoDB:
     """MongoDB connection manager"""
@@ -14,13 +58,64 @@ class MongoDB:
 mongodb = MongoDB()
 
 
+class Collections:
+    """Collection handles bound once at connect time"""
+
+    users: AsyncIOMotorCollection = None
+    progress_state: AsyncIOMotorCollection = None
+    exercises: AsyncIOMotorCollection = None
+    exercise_attempts: AsyncIOMotorCollection = None
+    chat_sessions: AsyncIOMotorCollection = None
+    chat_messages: AsyncIOMotorCollection = None
+    user_progress: AsyncIOMotorCollection = None
+
+
+collections = Collections()
+
+
+def _bind_collections(db: AsyncIOMotorDatabase):
+    """Resolve the hot collection handles once instead of per request"""
+    collections.users = db.users
+    collections.progress_state = db.progress_state
+    collections.exercises = db.exercises
+    collections.exercise_attempts = db.exercise_attempts
+    collections.chat_sessions = db.chat_sessions
+    collections.chat_messages = db.chat_messages
+    collections.user_progress = db.user_progress
+
+
 async def connect_to_mongodb():
     """Connect to MongoDB"""
-    mongodb.client = AsyncIOMotorClient(settings.MONGODB_URL)
+    mongodb.client = AsyncIOMotorClient(
+        settings.MONGODB_URL,
+        maxPoolSize=settings.MONGODB_MAX_POOL_SIZE,
+        minPoolSize=settings.MONGODB_MIN_POOL_SIZE,
+        waitQueueTimeoutMS=settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+        serverSelectionTimeoutMS=settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        retryWrites=True,
+        compressors=settings.MONGODB_COMPRESSORS,
+    )
     mongodb.db = mongodb.client[settings.MONGODB_DB_NAME]
+    _bind_collections(mongodb.db)
     print(f"✅ Connected to MongoDB: {settings.MONGODB_DB_NAME}")
 
 
+async def create_indexes():
+    """Ensure indexes used by hot queries exist"""
+    created = 0
+    for collection, keys, options in INDEXES:
+        try:
+            await mongodb.db[collection].create_index(keys, **options)
+            created += 1
+        except OperationFailure as e:
+            if (collection, keys) in REQUIRED_INDEXES:
+                print(f"❌ Could not create required index on {collection} {keys}: {e}")
+                raise
+            # e.g. existing duplicates blocking a unique index; don't block startup
+            print(f"❌ Could not create index on {collection} {keys}: {e}")
+    print(f"✅ Ensured {created}/{len(INDEXES)} MongoDB indexes")
+
+
 async def close_mongodb_connection():
     """Close MongoDB connection"""
     if mongodb.client:
@@ -31,3 +126,8 @@ async def close_mongodb_connection():
 async def get_database() -> AsyncIOMotorDatabase:
     """Get database instance"""
     return mongodb.db
+
+
+async def get_collections() -> Collections:
+    """Get pre-bound collection handles"""
+    return collections
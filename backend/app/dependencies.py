@@ -4,7 +4,7 @@ from fastapi.security.http import HTTPAuthorizationCredentials
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from redis.asyncio import Redis
 from bson import ObjectId
-from app.db.mongodb import get_database
+from app.db.mongodb import Collections, get_collections, get_database
 from app.db.redis import get_redis
 from app.utils.security import decode_access_token
 from app.models.user import TokenData
@@ -17,6 +17,11 @@ async def get_db() -> AsyncIOMotorDatabase:
     return await get_database()
 
 
+async def get_cols() -> Collections:
+    """Dependency for pre-bound collection handles"""
+    return await get_collections()
+
+
 async def get_redis_client() -> Redis:
     """Dependency for Redis access"""
     return await get_redis()
@@ -24,7 +29,7 @@ async def get_redis_client() -> Redis:
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: AsyncIOMotorDatabase = Depends(get_db)
+    cols: Collections = Depends(get_cols)
 ) -> dict:
     """
     Dependency to get current authenticated user from JWT token
@@ -43,7 +48,7 @@ async def get_current_user(
 
     # Get user from database (convert string ID to ObjectId)
     try:
-        user = await db.users.find_one({"_id": ObjectId(token_data.user_id)})
+        user = await cols.users.find_one({"_id": ObjectId(token_data.user_id)})
     except Exception:
         raise credentials_exception
 
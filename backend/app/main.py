@@ -1,9 +1,15 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 from app.config import get_settings
-from app.db.mongodb import connect_to_mongodb, close_mongodb_connection
+from app.db.mongodb import connect_to_mongodb, close_mongodb_connection, create_indexes, get_database
 from app.db.redis import connect_to_redis, close_redis_connection
+from app.ai.chat_service import close_anthropic_client, drain_pending_writes
+from app.ai.dependencies import init_agents
+from app.services.progress_writer import progress_writer
+from app.utils.logger import setup_logging, shutdown_logging
+from app.utils.routing import AppJSONResponse
 from app.api.v1 import api_router
 
 settings = get_settings()
@@ -13,20 +19,35 @@ settings = get_settings()
 async def lifespan(app: FastAPI):
     """Lifespan events for startup and shutdown"""
     # Startup
+    setup_logging()
     await connect_to_mongodb()
+    await create_indexes()
     await connect_to_redis()
+    db = await get_database()
+    init_agents(app, db)
+    progress_writer.start(db.progress_state)
+    if settings.SANDBOX_BACKEND == "docker":
+        from app.sandbox.docker_runner import sandbox
+        await asyncio.to_thread(sandbox.start_pool)
     print(f"🚀 {settings.APP_NAME} started")
     yield
     # Shutdown
+    await drain_pending_writes()
+    await progress_writer.stop()
+    if settings.SANDBOX_BACKEND == "docker":
+        await asyncio.to_thread(sandbox.stop_pool)
     await close_mongodb_connection()
     await close_redis_connection()
+    await close_anthropic_client()
+    shutdown_logging()
     print(f"👋 {settings.APP_NAME} stopped")
 
 
 app = FastAPI(
     title=settings.APP_NAME,
     version=settings.APP_VERSION,
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=AppJSONResponse
 )
 
 # CORS middleware
@@ -63,10 +84,21 @@ async def health_check():
 
 
 if __name__ == "__main__":
+    import os
     import uvicorn
+    # One worker per core outside DEBUG (reload can't run multiple workers).
+    # Each worker runs the lifespan, so it gets its own Mongo/Redis clients,
+    # its own docker sandbox pool and its own copy of the in-process caches
+    # (exercises, test cases, pending session touches).
+    workers = 1 if settings.DEBUG else (os.cpu_count() or 1)
+    # Read by the docker sandbox to split SANDBOX_POOL_SIZE between workers
+    os.environ["WEB_CONCURRENCY"] = str(workers)
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
         port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=workers,
         reload=settings.DEBUG
     )
@@ -1,3 +1,4 @@
+from functools import cached_property
 from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
 from datetime import datetime
@@ -19,6 +20,16 @@ class TestCase(BaseModel):
     expected_output: Dict[str, Any] = {}
     validation_script: str
 
+    @cached_property
+    def expected_stdout(self) -> str:
+        """Expected stdout, or an empty string when the test doesn't check output"""
+        return self.expected_output.get("stdout") or ""
+
+    @cached_property
+    def expected_stdout_stripped(self) -> str:
+        """Expected stdout without surrounding whitespace, as compared by the validator"""
+        return self.expected_stdout.strip()
+
 
 class GradingRubric(BaseModel):
     """Grading criteria weights"""
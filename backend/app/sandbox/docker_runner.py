@@ -1,20 +1,100 @@
 """
 Docker-based sandbox for secure code execution
+
+Code runs via `docker exec` inside a small pool of long-lived containers per
+language, so a submission doesn't pay for container create/start/remove.
 """
 import docker
+import fcntl
+import math
 import tempfile
 import os
+import queue
+import shutil
+import threading
 import time
-from typing import Dict, Tuple
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
 from app.config import get_settings
+from app.sandbox.output import append_capped, decode_output
 
 settings = get_settings()
 
+# Limits resolved once instead of on every run
+SANDBOX_TIMEOUT = settings.SANDBOX_TIMEOUT
+MEM_LIMIT = settings.SANDBOX_MEMORY_LIMIT
+CPU_QUOTA = int(float(settings.SANDBOX_CPU_LIMIT) * 100000)
+PIDS_LIMIT = settings.SANDBOX_PIDS_LIMIT
+# SANDBOX_POOL_SIZE is the total per language; every server worker process
+# (WEB_CONCURRENCY, as set by uvicorn --workers or main.py) keeps its share
+WORKERS = max(1, int(os.environ.get("WEB_CONCURRENCY") or 1))
+POOL_SIZE = max(1, math.ceil(settings.SANDBOX_POOL_SIZE / WORKERS))
+CONTAINER_MAX_USES = settings.SANDBOX_CONTAINER_MAX_USES
+
+# Sandbox image for each supported language
+IMAGES = {
+    "python": "myteacher-sandbox-python",
+    "bash": "myteacher-sandbox-bash"
+}
+
+# Code file and interpreter command for each language, inside /workspace
+COMMANDS = {
+    "python": ("main.py", ["python", "/workspace/main.py"]),
+    "bash": ("script.sh", ["bash", "/workspace/script.sh"])
+}
+
+# Exit status of coreutils `timeout` when the command ran too long
+TIMEOUT_EXIT_CODE = 124
+# SIGKILL: the memory limit, or `timeout --kill-after` when SIGTERM was ignored
+KILLED_EXIT_CODE = 137
+
+# Workspaces live in RAM so writing a submission never touches the disk.
+# (docker can't copy into a container's own tmpfs mounts, so the file is
+# written on the host side of a bind mount instead of via put_archive.)
+WORKDIR_ROOT = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# Clears everything the previous run (possibly another user's) could have
+# left behind: files in the writable tmpfs mounts, POSIX message queues and
+# System V IPC objects. Then hands over to `timeout`; "$0" is the time limit
+# and "$@" the interpreter command
+RUN_SCRIPT = (
+    'find /tmp /dev/shm /dev/mqueue -mindepth 1 -delete 2>/dev/null; '
+    'ipcrm --all 2>/dev/null; '
+    'exec timeout --kill-after=1 "$0" "$@"'
+)
+
+# Run after every submission: kills whatever the sandbox user still has
+# running. kill(-1) skips PID 1 (the container's `sleep`) and the caller, so
+# it only succeeds when the submission left a process behind.
+CLEANUP_COMMAND = ["sh", "-c", "kill -9 -1 2>/dev/null"]
+
+
+def _write_file(path: str, content: str):
+    """Replace a file's contents; readable by the container's non-root user"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.write(fd, content.encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+@dataclass(slots=True)
+class _PooledContainer:
+    """A started sandbox container and the host directory mounted at /workspace"""
+    container: "docker.models.containers.Container"
+    workdir: str
+    uses: int = 0
+
 
 class DockerSandbox:
     """Manages Docker-based code execution"""
 
     def __init__(self):
+        # Images already confirmed present, so runs skip the daemon lookup
+        self._known_images: set[str] = set()
+        # Idle containers per language; execute_code runs in worker threads
+        self._pools: Dict[str, queue.Queue] = {}
+        self._pool_lock = threading.Lock()
         try:
             self.client = docker.from_env()
             # Test connection
@@ -49,16 +129,9 @@ class DockerSandbox:
                 "execution_time": 0
             }
 
-        timeout = timeout or settings.SANDBOX_TIMEOUT
+        timeout = timeout or SANDBOX_TIMEOUT
 
-        # Select image based on language
-        image_map = {
-            "python": "myteacher-sandbox-python",
-            "bash": "myteacher-sandbox-bash"
-        }
-
-        image = image_map.get(language)
-        if not image:
+        if language not in IMAGES:
             return {
                 "stdout": "",
                 "stderr": f"Unsupported language: {language}",
@@ -66,80 +139,208 @@ class DockerSandbox:
                 "execution_time": 0
             }
 
-        # Create temporary directory for code
-        with tempfile.TemporaryDirectory() as tmpdir:
-            # Write code to file
-            if language == "python":
-                code_file = os.path.join(tmpdir, "main.py")
-                command = ["python", "/workspace/main.py"]
-            elif language == "bash":
-                code_file = os.path.join(tmpdir, "script.sh")
-                command = ["bash", "/workspace/script.sh"]
+        filename, command = COMMANDS[language]
+
+        try:
+            pooled = self._acquire(language, timeout)
+        except queue.Empty:
+            return {
+                "stdout": "",
+                "stderr": "Execution error: no sandbox available, try again",
+                "exit_code": 1,
+                "execution_time": 0
+            }
+        except Exception as e:
+            return {
+                "stdout": "",
+                "stderr": f"Execution error: {str(e)}",
+                "exit_code": 1,
+                "execution_time": 0
+            }
+
+        healthy = False
+        try:
+            # Write code into the container's read-only /workspace mount,
+            # straight through the fd without a Python file object
+            _write_file(os.path.join(pooled.workdir, filename), code)
+
+            start_time = time.time()
+
+            # On timeout, `timeout` signals its process group; processes that
+            # left the group (setsid, double fork) or outlive a normal exit
+            # are handled by _kill_leftovers before the container is reused
+            exit_code, stdout_bytes, stderr_bytes = self._exec_capped(
+                pooled.container,
+                ["sh", "-c", RUN_SCRIPT, str(timeout), *command]
+            )
+            execution_time = time.time() - start_time
+
+            stdout = decode_output(stdout_bytes)
+            stderr = decode_output(stderr_bytes)
 
-            with open(code_file, "w") as f:
-                f.write(code)
+            if exit_code == TIMEOUT_EXIT_CODE or (
+                exit_code == KILLED_EXIT_CODE and execution_time >= timeout
+            ):
+                stderr = f"Execution timed out after {timeout} seconds"
+            elif exit_code == KILLED_EXIT_CODE:
+                # Killed before the time limit: the memory limit was hit
+                stderr = f"{stderr}\nExecution killed: memory limit of {MEM_LIMIT} exceeded".lstrip()
+            else:
+                healthy = True
 
-            # Build image if it doesn't exist
+            return {
+                "stdout": stdout,
+                "stderr": stderr,
+                "exit_code": exit_code,
+                "execution_time": execution_time
+            }
+
+        except Exception as e:
+            return {
+                "stdout": "",
+                "stderr": f"Execution error: {str(e)}",
+                "exit_code": 1,
+                "execution_time": 0
+            }
+        finally:
+            if healthy:
+                healthy = self._kill_leftovers(pooled)
+            self._release(language, pooled, healthy)
+
+    def ensure_image(self, language: str):
+        """Build the language's image if the daemon doesn't have it yet"""
+        image = IMAGES[language]
+        if image in self._known_images:
+            return
+        # Every worker starts its pool at the same time; the lock makes one
+        # build the image while the others wait and then find it present
+        with open(os.path.join(tempfile.gettempdir(), f"{image}.build.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
             try:
                 self.client.images.get(image)
             except docker.errors.ImageNotFound:
                 self._build_image(language, image)
+        self._known_images.add(image)
 
-            # Execute in container
+    def start_pool(self):
+        """Build images and start POOL_SIZE idle containers per language"""
+        if not self.client:
+            return
+        for language in IMAGES:
             try:
-                start_time = time.time()
-
-                container = self.client.containers.run(
-                    image=image,
-                    command=command,
-                    volumes={tmpdir: {"bind": "/workspace", "mode": "ro"}},
-                    network_mode="none",  # No network access
-                    mem_limit=settings.SANDBOX_MEMORY_LIMIT,
-                    cpu_quota=int(float(settings.SANDBOX_CPU_LIMIT) * 100000),
-                    detach=True,
-                    remove=True,
-                    security_opt=["no-new-privileges"],
-                    cap_drop=["ALL"]
-                )
-
-                # Wait for completion with timeout
-                result = container.wait(timeout=timeout)
-                execution_time = time.time() - start_time
-
-                # Get logs
-                logs = container.logs(stdout=True, stderr=True)
-                output = logs.decode("utf-8")
-
-                # Separate stdout and stderr (simplified)
-                stdout = output
-                stderr = ""
-                exit_code = result["StatusCode"]
-
-                # Truncate output if too large
-                if len(stdout) > settings.MAX_OUTPUT_SIZE:
-                    stdout = stdout[:settings.MAX_OUTPUT_SIZE] + "\n... (output truncated)"
-
-                return {
-                    "stdout": stdout,
-                    "stderr": stderr,
-                    "exit_code": exit_code,
-                    "execution_time": execution_time
-                }
-
-            except docker.errors.ContainerError as e:
-                return {
-                    "stdout": e.stdout.decode("utf-8") if e.stdout else "",
-                    "stderr": e.stderr.decode("utf-8") if e.stderr else str(e),
-                    "exit_code": e.exit_status,
-                    "execution_time": 0
-                }
+                self._get_pool(language)
             except Exception as e:
-                return {
-                    "stdout": "",
-                    "stderr": f"Execution error: {str(e)}",
-                    "exit_code": 1,
-                    "execution_time": 0
-                }
+                print(f"❌ Failed to start {language} sandbox pool: {e}")
+
+    def stop_pool(self):
+        """Remove every idle pooled container"""
+        with self._pool_lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            while True:
+                try:
+                    self._discard(pool.get_nowait())
+                except queue.Empty:
+                    break
+
+    def _get_pool(self, language: str) -> queue.Queue:
+        """Return the language's pool, starting its containers on first use"""
+        with self._pool_lock:
+            pool = self._pools.get(language)
+            if pool is None:
+                self.ensure_image(language)
+                pool = queue.Queue()
+                for _ in range(POOL_SIZE):
+                    pool.put(self._start_container(language))
+                self._pools[language] = pool
+                print(f"✅ Started {POOL_SIZE} {language} sandbox containers")
+            return pool
+
+    def _acquire(self, language: str, timeout: int) -> _PooledContainer:
+        """Wait for an idle container; raises queue.Empty if none frees up in time"""
+        return self._get_pool(language).get(timeout=timeout)
+
+    def _release(self, language: str, pooled: _PooledContainer, healthy: bool):
+        """Return a container to its pool, replacing it when worn out or suspect"""
+        pooled.uses += 1
+        if healthy and pooled.uses < CONTAINER_MAX_USES:
+            self._return(language, pooled)
+            return
+
+        self._discard(pooled)
+        try:
+            self._return(language, self._start_container(language))
+        except Exception as e:
+            # The pool shrinks by one until the next restart
+            print(f"❌ Failed to replace {language} sandbox container: {e}")
+
+    def _exec_capped(self, container, cmd: List[str]) -> Tuple[int, bytes, bytes]:
+        """Run a command in a container, streaming its output capped as described in app.sandbox.output"""
+        api = self.client.api
+        exec_id = api.exec_create(container.id, cmd)["Id"]
+        stdout, stderr = bytearray(), bytearray()
+        for stdout_chunk, stderr_chunk in api.exec_start(exec_id, stream=True, demux=True):
+            append_capped(stdout, stdout_chunk)
+            append_capped(stderr, stderr_chunk)
+        exit_code = api.exec_inspect(exec_id)["ExitCode"]
+        return exit_code, bytes(stdout), bytes(stderr)
+
+    def _kill_leftovers(self, pooled: _PooledContainer) -> bool:
+        """
+        Kill processes the last submission left running in its container
+
+        Returns True if none were found. Otherwise the container is reported
+        unhealthy and replaced, since killed orphans linger as zombies under
+        `sleep`, which never reaps them.
+        """
+        try:
+            exit_code, _ = pooled.container.exec_run(CLEANUP_COMMAND)
+        except Exception:
+            return False
+        return exit_code != 0
+
+    def _return(self, language: str, pooled: _PooledContainer):
+        pool = self._pools.get(language)
+        if pool is None:
+            # Pool was stopped while this container was in use
+            self._discard(pooled)
+        else:
+            pool.put(pooled)
+
+    def _start_container(self, language: str) -> _PooledContainer:
+        """Start an idle container that waits for `docker exec` calls"""
+        workdir = tempfile.mkdtemp(prefix=f"sandbox-{language}-", dir=WORKDIR_ROOT)
+        # The container's non-root user must be able to read the code files
+        os.chmod(workdir, 0o755)
+        try:
+            container = self.client.containers.run(
+                image=IMAGES[language],
+                command=["sleep", "infinity"],
+                volumes={workdir: {"bind": "/workspace", "mode": "ro"}},
+                # Small private /dev/shm instead of docker's default 64m one
+                tmpfs={"/tmp": "size=16m", "/dev/shm": "size=16m"},
+                read_only=True,  # Only the tmpfs mounts are writable, and they're cleared before each run
+                network_mode="none",  # No network access
+                mem_limit=MEM_LIMIT,
+                cpu_quota=CPU_QUOTA,
+                pids_limit=PIDS_LIMIT,  # Containers are long-lived, so cap fork bombs
+                detach=True,
+                remove=True,
+                security_opt=["no-new-privileges"],
+                cap_drop=["ALL"]
+            )
+        except Exception:
+            shutil.rmtree(workdir, ignore_errors=True)
+            raise
+        return _PooledContainer(container=container, workdir=workdir)
+
+    def _discard(self, pooled: _PooledContainer):
+        """Kill a container (auto-removed) and delete its workspace"""
+        try:
+            pooled.container.kill()
+        except Exception:
+            pass
+        shutil.rmtree(pooled.workdir, ignore_errors=True)
 
     def _build_image(self, language: str, image_name: str):
         """Build sandbox Docker image"""
@@ -0,0 +1,29 @@
+"""
+Bounded capture of sandbox output, shared by the sandbox runners
+
+Runners read a submission's stdout/stderr as it arrives and keep at most
+MAX_OUTPUT_SIZE + 1 bytes of each stream, dropping the rest, so a print loop
+can't grow server memory. The extra byte tells decode_output that the stream
+was truncated.
+"""
+from app.config import get_settings
+
+settings = get_settings()
+
+MAX_OUTPUT_SIZE = settings.MAX_OUTPUT_SIZE
+
+TRUNCATION_MARKER = "\n... (output truncated)"
+
+
+def append_capped(buffer: bytearray, chunk: bytes):
+    """Append a chunk of output, keeping at most MAX_OUTPUT_SIZE + 1 bytes"""
+    room = MAX_OUTPUT_SIZE + 1 - len(buffer)
+    if chunk and room > 0:
+        buffer += chunk[:room]
+
+
+def decode_output(data: bytes) -> str:
+    """Decode captured output, truncated to MAX_OUTPUT_SIZE bytes before decoding"""
+    if len(data) > MAX_OUTPUT_SIZE:
+        return data[:MAX_OUTPUT_SIZE].decode("utf-8", errors="replace") + TRUNCATION_MARKER
+    return data.decode("utf-8", errors="replace")
@@ -2,23 +2,139 @@
 Subprocess-based sandbox for secure code execution
 A lightweight alternative to Docker sandbox for development/testing
 """
+import os
+import selectors
+import shutil
 import subprocess
 import tempfile
-import os
 import time
-import signal
-from typing import Dict
+from typing import Dict, List, Tuple
 from app.config import get_settings
+from app.sandbox.output import append_capped, decode_output
 
 settings = get_settings()
 
+# Limits resolved once instead of on every run
+SANDBOX_TIMEOUT = settings.SANDBOX_TIMEOUT
+
+# RAM-backed scratch space handed to submissions as TMPDIR
+SHM_TMPDIR = "/dev/shm/myteach-sandbox"
+
+# Interpreters resolved to absolute paths once. Together with close_fds=False
+# (the server's own fds are non-inheritable anyway, PEP 446), no preexec_fn and
+# no cwd, this lets subprocess use posix_spawn instead of fork+exec, so spawn
+# cost doesn't grow with the server's memory footprint.
+PYTHON_BIN = shutil.which("python3") or "/usr/bin/python3"
+BASH_BIN = shutil.which("bash") or "/bin/bash"
+SH_BIN = shutil.which("sh") or "/bin/sh"
+
+# Multipliers for the docker-style suffixes used by SANDBOX_MEMORY_LIMIT
+_SIZE_SUFFIXES = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+
+
+def _parse_size(value: str) -> int:
+    """Convert a size such as "256m" to bytes"""
+    value = value.strip().lower().rstrip("b")
+    if value and value[-1] in _SIZE_SUFFIXES:
+        return int(float(value[:-1]) * _SIZE_SUFFIXES[value[-1]])
+    return int(value)
+
+
+MEMORY_LIMIT_KB = _parse_size(settings.SANDBOX_MEMORY_LIMIT) // 1024
+
+# Largest file a submission may write, in the 512-byte blocks of `ulimit -f`;
+# scratch files live in RAM, which the address-space limit doesn't cover
+FILE_SIZE_LIMIT_BLOCKS = 16 * 1024 * 1024 // 512
+
+# Caps the address space ("$1", KiB), CPU time ("$2", seconds) and file size
+# ("$3", blocks) of the shell itself, then execs the command, so the limits
+# are inherited before any submitted code runs. Doing this in the child keeps
+# posix_spawn usable (a preexec_fn would force fork+exec). Process count is
+# not limited: RLIMIT_NPROC counts every process of the server's uid, not
+# just the sandbox.
+LIMITS_SCRIPT = 'ulimit -v "$1" && ulimit -t "$2" && ulimit -f "$3" && shift 3 && exec "$@"'
+
+
+def _with_limits(argv: List[str], timeout: int) -> List[str]:
+    """Prefix a command with the shell wrapper that applies the resource limits"""
+    return [
+        SH_BIN, "-c", LIMITS_SCRIPT, "sh",
+        str(MEMORY_LIMIT_KB), str(timeout + 1), str(FILE_SIZE_LIMIT_BLOCKS),
+        *argv
+    ]
+
+
+# Bytes read from a pipe at a time
+READ_CHUNK_SIZE = 4096
+
+
+def _run_captured(argv: List[str], env: Dict[str, str], timeout: int) -> Tuple[int, bytes, bytes]:
+    """
+    Run a command and capture its output, capped as described in
+    app.sandbox.output
+
+    Raises:
+        subprocess.TimeoutExpired: The command ran longer than timeout (it is killed)
+    """
+    deadline = time.monotonic() + timeout
+    proc = subprocess.Popen(
+        _with_limits(argv, timeout),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=env,
+        # Prevent shell injection
+        shell=False,
+        close_fds=False
+    )
+    buffers = {proc.stdout: bytearray(), proc.stderr: bytearray()}
+    try:
+        with selectors.DefaultSelector() as selector:
+            for pipe in buffers:
+                selector.register(pipe, selectors.EVENT_READ)
+            # Drain both pipes until the command (and anything it started)
+            # closes them, so neither can fill up and stall it
+            while selector.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise subprocess.TimeoutExpired(argv, timeout)
+                for key, _ in selector.select(remaining):
+                    chunk = os.read(key.fd, READ_CHUNK_SIZE)
+                    if not chunk:
+                        selector.unregister(key.fileobj)
+                        continue
+                    append_capped(buffers[key.fileobj], chunk)
+        returncode = proc.wait(timeout=max(deadline - time.monotonic(), 0))
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        proc.stdout.close()
+        proc.stderr.close()
+    return returncode, bytes(buffers[proc.stdout]), bytes(buffers[proc.stderr])
+
 
 class SubprocessSandbox:
     """Manages subprocess-based code execution with security limits"""
 
     def __init__(self):
+        self._tmpdir = self._resolve_tmpdir()
+        # Built once and shared by every run; each run adds its own TMPDIR
+        self._env = self._build_restricted_env()
         print("✅ Subprocess sandbox initialized")
 
+    @staticmethod
+    def _resolve_tmpdir() -> str:
+        """Use a tmpfs directory for per-run scratch space when /dev/shm exists"""
+        if os.path.isdir("/dev/shm"):
+            try:
+                os.makedirs(SHM_TMPDIR, exist_ok=True)
+                return SHM_TMPDIR
+            except OSError:
+                pass
+        return tempfile.gettempdir()
+
     def execute_code(
         self,
         code: str,
@@ -36,12 +152,12 @@ class SubprocessSandbox:
         Returns:
             Dict with stdout, stderr, exit_code, execution_time
         """
-        timeout = timeout or settings.SANDBOX_TIMEOUT
+        timeout = timeout or SANDBOX_TIMEOUT
 
         if language == "python":
-            return self._execute_python(code, timeout)
+            execute = self._execute_python
         elif language == "bash":
-            return self._execute_bash(code, timeout)
+            execute = self._execute_bash
         else:
             return {
                 "stdout": "",
@@ -50,41 +166,36 @@ class SubprocessSandbox:
                 "execution_time": 0
             }
 
-    def _execute_python(self, code: str, timeout: int) -> Dict:
-        """Execute Python code"""
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
-            f.write(code)
-            temp_file = f.name
+        # Each run gets its own scratch directory, removed afterwards, so files
+        # a submission leaves behind neither reach the next run nor pile up in RAM
+        run_tmpdir = tempfile.mkdtemp(prefix="run-", dir=self._tmpdir)
+        try:
+            return execute(code, timeout, {**self._env, "TMPDIR": run_tmpdir})
+        finally:
+            shutil.rmtree(run_tmpdir, ignore_errors=True)
 
+    def _execute_python(self, code: str, timeout: int, env: Dict[str, str]) -> Dict:
+        """Execute Python code"""
         try:
             start_time = time.time()
 
-            # Run Python with restricted environment
-            result = subprocess.run(
-                ['python3', temp_file],
-                capture_output=True,
-                timeout=timeout,
-                text=True,
-                env=self._get_restricted_env(),
-                # Prevent shell injection
-                shell=False
+            # Run Python with restricted environment; the code is passed as an
+            # argument (MAX_CODE_LENGTH is far below ARG_MAX), so nothing is
+            # written to disk and stdin stays free.
+            # -I: ignore PYTHON* env vars and the user site dir; site-packages
+            # stay importable, as exercises may use third-party packages
+            returncode, stdout, stderr = _run_captured(
+                [PYTHON_BIN, '-I', '-c', code],
+                env,
+                timeout
             )
 
             execution_time = time.time() - start_time
 
-            # Truncate output if too large
-            stdout = result.stdout
-            stderr = result.stderr
-
-            if len(stdout) > settings.MAX_OUTPUT_SIZE:
-                stdout = stdout[:settings.MAX_OUTPUT_SIZE] + "\n... (output truncated)"
-            if len(stderr) > settings.MAX_OUTPUT_SIZE:
-                stderr = stderr[:settings.MAX_OUTPUT_SIZE] + "\n... (output truncated)"
-
             return {
-                "stdout": stdout,
-                "stderr": stderr,
-                "exit_code": result.returncode,
+                "stdout": decode_output(stdout),
+                "stderr": decode_output(stderr),
+                "exit_code": returncode,
                 "execution_time": execution_time
             }
 
@@ -102,50 +213,25 @@ class SubprocessSandbox:
                 "exit_code": 1,
                 "execution_time": 0
             }
-        finally:
-            # Clean up temp file
-            try:
-                os.unlink(temp_file)
-            except:
-                pass
 
-    def _execute_bash(self, code: str, timeout: int) -> Dict:
+    def _execute_bash(self, code: str, timeout: int, env: Dict[str, str]) -> Dict:
         """Execute Bash script"""
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.sh', delete=False) as f:
-            f.write(code)
-            temp_file = f.name
-
-        # Make script executable
-        os.chmod(temp_file, 0o755)
-
         try:
             start_time = time.time()
 
-            # Run Bash with restricted environment
-            result = subprocess.run(
-                ['bash', temp_file],
-                capture_output=True,
-                timeout=timeout,
-                text=True,
-                env=self._get_restricted_env(),
-                shell=False
+            # Run Bash with restricted environment, script passed inline
+            returncode, stdout, stderr = _run_captured(
+                [BASH_BIN, '-c', code],
+                env,
+                timeout
             )
 
             execution_time = time.time() - start_time
 
-            # Truncate output if too large
-            stdout = result.stdout
-            stderr = result.stderr
-
-            if len(stdout) > settings.MAX_OUTPUT_SIZE:
-                stdout = stdout[:settings.MAX_OUTPUT_SIZE] + "\n... (output truncated)"
-            if len(stderr) > settings.MAX_OUTPUT_SIZE:
-                stderr = stderr[:settings.MAX_OUTPUT_SIZE] + "\n... (output truncated)"
-
             return {
-                "stdout": stdout,
-                "stderr": stderr,
-                "exit_code": result.returncode,
+                "stdout": decode_output(stdout),
+                "stderr": decode_output(stderr),
+                "exit_code": returncode,
                 "execution_time": execution_time
             }
 
@@ -163,15 +249,9 @@ class SubprocessSandbox:
                 "exit_code": 1,
                 "execution_time": 0
             }
-        finally:
-            # Clean up temp file
-            try:
-                os.unlink(temp_file)
-            except:
-                pass
 
-    def _get_restricted_env(self) -> Dict[str, str]:
-        """Get restricted environment variables"""
+    def _build_restricted_env(self) -> Dict[str, str]:
+        """Build the restricted environment variables"""
         # Minimal safe environment
         return {
             'PATH': '/usr/local/bin:/usr/bin:/bin',
@@ -182,6 +262,5 @@ class SubprocessSandbox:
             'https_proxy': 'http://127.0.0.1:1',
         }
 
-
 # Singleton instance
 sandbox = SubprocessSandbox()
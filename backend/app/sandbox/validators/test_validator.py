@@ -1,13 +1,13 @@
 """
 Test case validation logic
 """
-from typing import Dict, List, Any
+from typing import List
 from app.models.exercise import TestCase, TestResult, ExecutionResult
 
 
 def validate_test_cases(
     execution_result: ExecutionResult,
-    test_cases: List[Any],  # Can be dict or TestCase
+    test_cases: List[TestCase],
     language: str
 ) -> List[TestResult]:
     """
@@ -15,95 +15,42 @@ def validate_test_cases(
 
     Args:
         execution_result: Result from sandbox execution
-        test_cases: List of test cases to validate (dicts or TestCase objects)
+        test_cases: List of test cases to validate
         language: Programming language
 
     Returns:
         List of test results
     """
-    results = []
+    # Nothing to check, and no output to strip or wrap
+    if not test_cases:
+        return []
 
     # If execution failed, all tests fail
     if execution_result.exit_code != 0:
-        for i, test_case in enumerate(test_cases):
-            test_id = test_case.get("test_id", f"test_{i}") if isinstance(test_case, dict) else test_case.test_id
-            results.append(TestResult(
-                test_id=test_id,
-                passed=False,
-                error_message=f"Execution failed: {execution_result.stderr}"
-            ))
-        return results
-
-    # Validate each test case
-    for test_case in test_cases:
-        result = validate_single_test(
-            execution_result,
-            test_case,
-            language
-        )
-        results.append(result)
-
-    return results
-
-
-def validate_single_test(
-    execution_result: ExecutionResult,
-    test_case: Any,  # Can be dict or TestCase
-    language: str
-) -> TestResult:
-    """Validate a single test case"""
-
-    try:
-        # Handle both dict and TestCase object
-        if isinstance(test_case, dict):
-            test_id = test_case.get("test_id", "test_1")
-            expected_output = test_case.get("expected_output", {})
-        else:
-            test_id = test_case.test_id
-            expected_output = test_case.expected_output
-
-        # Check expected output
-        expected_stdout = expected_output.get("stdout", "") if isinstance(expected_output, dict) else ""
-        actual_stdout = execution_result.stdout
-
-        # Simple string comparison
-        if expected_stdout:
-            if actual_stdout.strip() == expected_stdout.strip():
-                return TestResult(
-                    test_id=test_id,
-                    passed=True,
-                    actual_output={"stdout": actual_stdout}
-                )
-            else:
-                return TestResult(
-                    test_id=test_id,
-                    passed=False,
-                    actual_output={"stdout": actual_stdout},
-                    error_message=f"Expected: '{expected_stdout}', Got: '{actual_stdout}'"
-                )
-
-        # If no specific output expected, check exit code
-        if execution_result.exit_code == 0:
-            return TestResult(
-                test_id=test_id,
-                passed=True,
-                actual_output={"stdout": actual_stdout}
-            )
-        else:
-            return TestResult(
-                test_id=test_id,
-                passed=False,
-                actual_output={"stdout": actual_stdout},
-                error_message="Non-zero exit code"
-            )
-
-    except Exception as e:
-        test_id = test_case.get("test_id", "test_error") if isinstance(test_case, dict) else "test_error"
-        return TestResult(
-            test_id=test_id,
+        error_message = f"Execution failed: {execution_result.stderr}"
+        return [
+            TestResult(test_id=test_case.test_id, passed=False, error_message=error_message)
+            for test_case in test_cases
+        ]
+
+    # Output is the same for every test case, so it's stripped and wrapped once;
+    # the expected side is stripped once per cached TestCase
+    actual_stdout = execution_result.stdout
+    actual_stripped = actual_stdout.strip()
+    actual_output = {"stdout": actual_stdout}
+
+    # With a clean exit, a test without expected stdout passes
+    return [
+        TestResult(test_id=test_case.test_id, passed=True, actual_output=actual_output)
+        if not test_case.expected_stdout or test_case.expected_stdout_stripped == actual_stripped
+        else TestResult(
+            test_id=test_case.test_id,
             passed=False,
-            error_message=f"Validation error: {str(e)}"
+            actual_output=actual_output,
+            error_message=f"Expected: '{test_case.expected_stdout}', Got: '{actual_stdout}'"
         )
+        for test_case in test_cases
+    ]
 
 
 def calculate_score(test_results: List[TestResult]) -> int:
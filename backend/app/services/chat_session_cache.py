@@ -0,0 +1,48 @@
+"""
+Redis cache of active chat session ids
+
+Kept in Redis rather than in-process so closing a session in one worker is
+seen by every other worker.
+"""
+from typing import Optional
+from bson import ObjectId
+from app.db.redis import get_redis
+
+# Bounds how long a session closed without invalidation keeps being reused
+CHAT_SESSION_TTL = 300
+
+
+def chat_session_key(user_id: str, context_type: str, context_id: Optional[str]) -> str:
+    return f"chat_session:{user_id}:{context_type}:{context_id or ''}"
+
+
+async def get_cached_chat_session(
+    user_id: str, context_type: str, context_id: Optional[str]
+) -> Optional[ObjectId]:
+    redis = await get_redis()
+    if redis is None:
+        return None
+    session_id = await redis.get(chat_session_key(user_id, context_type, context_id))
+    return ObjectId(session_id) if session_id else None
+
+
+async def cache_chat_session(
+    user_id: str, context_type: str, context_id: Optional[str], session_id: ObjectId
+):
+    redis = await get_redis()
+    if redis is not None:
+        await redis.set(
+            chat_session_key(user_id, context_type, context_id),
+            str(session_id),
+            ex=CHAT_SESSION_TTL
+        )
+
+
+async def invalidate_chat_sessions(user_id: str, context_type: str, context_id: Optional[str]):
+    """Drop the cached lookups that could resolve to a session that was just closed"""
+    redis = await get_redis()
+    if redis is not None:
+        await redis.delete(
+            chat_session_key(user_id, context_type, context_id),
+            chat_session_key(user_id, context_type, None)
+        )
@@ -0,0 +1,18 @@
+"""
+Redis cache of per-user dashboard stats
+"""
+from app.db.redis import get_redis
+
+# Dashboard JSON is reused for this long, or until the user's next attempt
+DASHBOARD_CACHE_TTL = 60
+
+
+def dashboard_cache_key(user_id: str) -> str:
+    return f"dash:{user_id}"
+
+
+async def invalidate_dashboard(user_id: str):
+    """Drop a user's cached dashboard after their attempts change"""
+    redis = await get_redis()
+    if redis is not None:
+        await redis.delete(dashboard_cache_key(user_id))
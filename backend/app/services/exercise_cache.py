@@ -0,0 +1,49 @@
+"""
+In-process cache of exercise documents
+"""
+from typing import Dict, List, Optional
+from cachetools import TTLCache
+from motor.motor_asyncio import AsyncIOMotorCollection
+from app.models.exercise import TestCase
+
+# exercise_id -> exercise document. The app only ever inserts exercises (with
+# fresh ids), so nothing in-process invalidates entries; documents changed
+# out of band, e.g. by re-running scripts/seed_database.py, can be served
+# stale by each worker until the TTL expires.
+_exercise_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+
+# exercise_id -> the exercise's test cases parsed into TestCase objects, so
+# grading doesn't re-check the shape of every test case on each submission
+_test_case_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+
+
+async def get_exercise_cached(
+    exercises: AsyncIOMotorCollection,
+    exercise_id: str
+) -> Optional[Dict]:
+    """
+    Get an exercise by exercise_id, reading through the cache
+
+    The returned document is shared between callers and must not be mutated.
+    Misses are not cached, so a newly generated exercise is visible immediately.
+    """
+    exercise = _exercise_cache.get(exercise_id)
+    if exercise is None:
+        exercise = await exercises.find_one({"exercise_id": exercise_id})
+        if exercise is not None:
+            _exercise_cache[exercise_id] = exercise
+    return exercise
+
+
+def get_test_cases_cached(exercise: Dict) -> List[TestCase]:
+    """
+    Get an exercise's test cases as TestCase objects, parsing them once per load
+
+    The returned list is shared between callers and must not be mutated.
+    """
+    exercise_id = exercise["exercise_id"]
+    test_cases = _test_case_cache.get(exercise_id)
+    if test_cases is None:
+        test_cases = [TestCase(**tc) for tc in exercise.get("test_cases", [])]
+        _test_case_cache[exercise_id] = test_cases
+    return test_cases
@@ -1,21 +1,50 @@
 """
 Exercise grading service
 """
-from datetime import datetime
+from datetime import datetime, timezone
 from bson import ObjectId
+import asyncio
 from motor.motor_asyncio import AsyncIOMotorDatabase
-# Use subprocess sandbox instead of Docker for development
-from app.sandbox.subprocess_runner import sandbox
+from typing import Awaitable, Optional
+from app.config import get_settings
+from app.services.exercise_cache import get_exercise_cached, get_test_cases_cached
 from app.sandbox.validators.test_validator import validate_test_cases, calculate_score
 from app.models.exercise import ExecutionResult, TestResult
 
+settings = get_settings()
+
+# Subprocess sandbox for development; Docker when SANDBOX_BACKEND=docker
+if settings.SANDBOX_BACKEND == "docker":
+    from app.sandbox.docker_runner import sandbox
+else:
+    from app.sandbox.subprocess_runner import sandbox
+
+# Feedback templates; {failures} is one "- test_id: error" line per failed test
+_PASSED_FEEDBACK = (
+    "🎉 Great job! You passed all {passed}/{total} test cases.\n\n"
+    "Your solution is correct. Ready to move on to the next exercise!"
+)
+_NONE_PASSED_FEEDBACK = (
+    "❌ None of the test cases passed ({passed}/{total}).\n\n"
+    "Let's review the requirements:\n"
+    "{failures}"
+    "\nTip: Try running your code locally first to see the output."
+)
+_SOME_PASSED_FEEDBACK = (
+    "⚠️  Some test cases passed ({passed}/{total}), but not all.\n\n"
+    "Failed tests:\n"
+    "{failures}"
+    "\nYou're close! Review the failed test cases and try again."
+)
+
 
 async def grade_exercise(
     db: AsyncIOMotorDatabase,
     submission_id: str,
     exercise_id: str,
     code: str,
-    language: str
+    language: str,
+    attempt_written: Optional[Awaitable] = None
 ) -> dict:
     """
     Grade an exercise submission
@@ -26,14 +55,19 @@ async def grade_exercise(
         exercise_id: Exercise ID
         code: Submitted code
         language: Programming language
+        attempt_written: Pending write of the attempt document, if it is still
+            in flight; awaited only before the grade is stored, so it overlaps
+            with the exercise lookup and the sandbox run
 
     Returns:
         Grading result dictionary
     """
 
-    # Get exercise from database
-    exercise = await db.exercises.find_one({"exercise_id": exercise_id})
+    # Get exercise, usually from the in-process cache
+    exercise = await get_exercise_cached(db.exercises, exercise_id)
     if not exercise:
+        if attempt_written is not None:
+            await attempt_written
         return {
             "error": "Exercise not found",
             "score": 0,
@@ -43,15 +77,16 @@ async def grade_exercise(
     # Build complete code with validation scripts
     # For exercises with validation scripts, append them to execute the functions
     complete_code = code
-    test_cases = exercise.get("test_cases", [])
+    test_cases = get_test_cases_cached(exercise)
 
     # If there are validation scripts, append them to call the user's functions
-    if test_cases and test_cases[0].get("validation_script"):
-        validation_script = test_cases[0].get("validation_script")
+    if test_cases and test_cases[0].validation_script:
+        validation_script = test_cases[0].validation_script
         complete_code = f"{code}\n\n# Test execution\n{validation_script}"
 
-    # Execute code in sandbox
-    exec_result = sandbox.execute_code(complete_code, language)
+    # Execute code in sandbox; it blocks on the child process, so run it in a
+    # worker thread and keep the event loop serving other requests
+    exec_result = await asyncio.to_thread(sandbox.execute_code, complete_code, language)
 
     execution_result = ExecutionResult(
         stdout=exec_result["stdout"],
@@ -61,7 +96,6 @@ async def grade_exercise(
     )
 
     # Validate test cases
-    test_cases = [tc for tc in exercise.get("test_cases", [])]
     test_results = validate_test_cases(execution_result, test_cases, language)
 
     # Calculate score
@@ -71,16 +105,22 @@ async def grade_exercise(
     # Generate feedback
     feedback = generate_feedback(test_results, score, passed)
 
-    # Update attempt in database
+    # Serialized once, for both the stored attempt and the returned result
+    execution_result_dict = execution_result.model_dump()
+    test_result_dicts = [tr.model_dump() for tr in test_results]
+
+    # Update attempt in database, once the attempt itself has landed
+    if attempt_written is not None:
+        await attempt_written
     await db.exercise_attempts.update_one(
         {"_id": ObjectId(submission_id)},
         {
             "$set": {
-                "execution_result": execution_result.dict(),
-                "test_results": [tr.dict() for tr in test_results],
+                "execution_result": execution_result_dict,
+                "test_results": test_result_dicts,
                 "score": score,
                 "feedback": feedback,
-                "graded_at": datetime.utcnow()
+                "graded_at": datetime.now(timezone.utc)
             }
         }
     )
@@ -89,9 +129,9 @@ async def grade_exercise(
         "submission_id": submission_id,
         "score": score,
         "passed": passed,
-        "test_results": test_results,
+        "test_results": test_result_dicts,
         "feedback": feedback,
-        "execution_result": execution_result
+        "execution_result": execution_result_dict
     }
 
 
@@ -102,25 +142,13 @@ def generate_feedback(
 ) -> str:
     """Generate human-readable feedback"""
 
+    failed = [tr for tr in test_results if not tr.passed]
     total_tests = len(test_results)
-    passed_tests = sum(1 for tr in test_results if tr.passed)
+    passed_tests = total_tests - len(failed)
 
     if passed:
-        feedback = f"🎉 Great job! You passed all {passed_tests}/{total_tests} test cases.\n\n"
-        feedback += "Your solution is correct. Ready to move on to the next exercise!"
-    elif passed_tests == 0:
-        feedback = f"❌ None of the test cases passed ({passed_tests}/{total_tests}).\n\n"
-        feedback += "Let's review the requirements:\n"
-        for tr in test_results:
-            if not tr.passed:
-                feedback += f"- {tr.test_id}: {tr.error_message}\n"
-        feedback += "\nTip: Try running your code locally first to see the output."
-    else:
-        feedback = f"⚠️  Some test cases passed ({passed_tests}/{total_tests}), but not all.\n\n"
-        feedback += "Failed tests:\n"
-        for tr in test_results:
-            if not tr.passed:
-                feedback += f"- {tr.test_id}: {tr.error_message}\n"
-        feedback += "\nYou're close! Review the failed test cases and try again."
-
-    return feedback
+        return _PASSED_FEEDBACK.format(passed=passed_tests, total=total_tests)
+
+    template = _NONE_PASSED_FEEDBACK if passed_tests == 0 else _SOME_PASSED_FEEDBACK
+    failures = "".join(f"- {tr.test_id}: {tr.error_message}\n" for tr in failed)
+    return template.format(passed=passed_tests, total=total_tests, failures=failures)
@@ -0,0 +1,81 @@
+"""
+Batched writer for progress_state updates
+"""
+import asyncio
+import logging
+from typing import List, Optional
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Most updates sent in one bulk_write, and how long to wait for a batch to fill
+PROGRESS_BATCH_MAX = 500
+PROGRESS_BATCH_WINDOW = 0.05
+
+
+class ProgressWriter:
+    """Queues progress_state updates and writes them with one bulk_write per batch"""
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.collection: Optional[AsyncIOMotorCollection] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, collection: AsyncIOMotorCollection):
+        """Start the background consumer"""
+        self.collection = collection
+        self._task = asyncio.create_task(self._run())
+
+    def enqueue(self, op: UpdateOne):
+        """Queue an update; it is written within PROGRESS_BATCH_WINDOW"""
+        self.queue.put_nowait(op)
+
+    async def stop(self):
+        """Write everything still queued, then stop the consumer"""
+        if self._task:
+            self.queue.put_nowait(None)
+            await self._task
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            op = await self.queue.get()
+            ops: List[UpdateOne] = [] if op is None else [op]
+            stopping = op is None
+
+            # Collect whatever else arrives within the window
+            deadline = loop.time() + PROGRESS_BATCH_WINDOW
+            while not stopping and len(ops) < PROGRESS_BATCH_MAX:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    op = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if op is None:
+                    stopping = True
+                else:
+                    ops.append(op)
+
+            # On shutdown, take anything queued behind the stop marker too
+            while stopping and not self.queue.empty():
+                op = self.queue.get_nowait()
+                if op is not None:
+                    ops.append(op)
+
+            for i in range(0, len(ops), PROGRESS_BATCH_MAX):
+                await self._write(ops[i:i + PROGRESS_BATCH_MAX])
+
+    async def _write(self, ops: List[UpdateOne]):
+        try:
+            # Ordered, so repeated updates to one user's progress apply in call order
+            await self.collection.bulk_write(ops)
+        except Exception:
+            logger.exception("❌ Failed to write %d progress updates", len(ops))
+
+
+progress_writer = ProgressWriter()
@@ -0,0 +1,32 @@
+"""
+Redis cache of the formatted user context sent with AI prompts
+"""
+from typing import Optional
+from app.db.redis import get_redis
+
+# Upper bound on staleness if a write ever skips invalidation
+USER_CONTEXT_AI_TTL = 600
+
+
+def user_context_ai_key(user_id: str) -> str:
+    return f"ctx_ai:{user_id}"
+
+
+async def get_cached_user_context_for_ai(user_id: str) -> Optional[str]:
+    redis = await get_redis()
+    if redis is None:
+        return None
+    return await redis.get(user_context_ai_key(user_id))
+
+
+async def cache_user_context_for_ai(user_id: str, summary: str):
+    redis = await get_redis()
+    if redis is not None:
+        await redis.set(user_context_ai_key(user_id), summary, ex=USER_CONTEXT_AI_TTL)
+
+
+async def invalidate_user_context_for_ai(user_id: str):
+    """Drop the cached summary after the user's context document changes"""
+    redis = await get_redis()
+    if redis is not None:
+        await redis.delete(user_context_ai_key(user_id))
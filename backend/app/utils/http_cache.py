@@ -0,0 +1,38 @@
+"""
+Conditional GET helpers (ETag / If-None-Match)
+"""
+from typing import Any
+from fastapi import Request, Response
+import hashlib
+import orjson
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the client's If-None-Match already names this ETag"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return etag in (tag.strip() for tag in if_none_match.split(","))
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    """Empty 304 response for a representation the client already has"""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+def json_with_etag(request: Request, content: Any, cache_control: str) -> Response:
+    """
+    Encode content once and tag it with a hash of the body
+
+    Returns 304 without the body when the client's copy is still current.
+    """
+    body = orjson.dumps(content)
+    etag = f'"{hashlib.md5(body).hexdigest()}"'
+    if etag_matches(request, etag):
+        return not_modified(etag, cache_control)
+
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": cache_control},
+    )
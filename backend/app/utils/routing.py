@@ -0,0 +1,49 @@
+"""
+orjson-backed request and response classes
+"""
+from typing import Any, Callable
+from bson import ObjectId
+from fastapi import Request, Response
+from fastapi.responses import ORJSONResponse
+from fastapi.routing import APIRoute
+import orjson
+
+
+def _orjson_default(obj: Any) -> Any:
+    """Encode types orjson doesn't know natively (datetimes it already handles)"""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+class AppJSONResponse(ORJSONResponse):
+    """ORJSONResponse that also serializes Mongo ObjectIds as strings"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content,
+            default=_orjson_default,
+            option=orjson.OPT_NON_STR_KEYS,
+        )
+
+
+class ORJSONRequest(Request):
+    """Request whose .json() is decoded by orjson instead of the stdlib json module"""
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = orjson.loads(await self.body())
+        return self._json
+
+
+class ORJSONRoute(APIRoute):
+    """APIRoute that hands its endpoint an ORJSONRequest"""
+
+    def get_route_handler(self) -> Callable:
+        original_route_handler = super().get_route_handler()
+
+        async def custom_route_handler(request: Request) -> Response:
+            request = ORJSONRequest(request.scope, request.receive)
+            return await original_route_handler(request)
+
+        return custom_route_handler
@@ -0,0 +1,44 @@
+"""
+Copy each exercise's difficulty onto its existing attempts
+
+The dashboard groups attempts by their own difficulty field, which is set
+when an attempt is created. Attempts written before that keep counting as
+beginner until migrated.
+"""
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateMany
+
+# MongoDB connection
+MONGODB_URL = "mongodb://localhost:27017"
+DB_NAME = "myteacher"
+
+async def backfill_attempt_difficulty():
+    """Set difficulty on attempts that don't have it yet"""
+    client = AsyncIOMotorClient(MONGODB_URL)
+    db = client[DB_NAME]
+
+    print("🔄 Backfilling attempt difficulty...")
+
+    # Attempts reference exercises by exercise_id or by the stringified _id
+    ops = []
+    async for exercise in db.exercises.find({}, {"exercise_id": 1, "difficulty": 1}):
+        exercise_refs = [str(exercise["_id"])]
+        if exercise.get("exercise_id"):
+            exercise_refs.append(exercise["exercise_id"])
+        ops.append(UpdateMany(
+            {"exercise_id": {"$in": exercise_refs}, "difficulty": {"$exists": False}},
+            {"$set": {"difficulty": exercise.get("difficulty", "beginner")}},
+        ))
+
+    if not ops:
+        print("⚠️  No exercises found")
+    else:
+        result = await db.exercise_attempts.bulk_write(ops, ordered=False)
+        print(f"✅ Backfilled {result.modified_count} attempts")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill_attempt_difficulty())
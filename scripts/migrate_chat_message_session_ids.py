@@ -0,0 +1,33 @@
+"""
+Convert chat_messages.session_id from hex strings to ObjectIds
+
+Messages written before session ids were stored as ObjectIds keep the
+string form and no longer match history lookups until migrated.
+"""
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+
+# MongoDB connection
+MONGODB_URL = "mongodb://localhost:27017"
+DB_NAME = "myteacher"
+
+
+async def migrate_chat_message_session_ids():
+    """Rewrite string session ids as ObjectIds in place"""
+    client = AsyncIOMotorClient(MONGODB_URL)
+    db = client[DB_NAME]
+
+    print("🔄 Migrating chat_messages.session_id to ObjectId...")
+
+    result = await db.chat_messages.update_many(
+        {"session_id": {"$type": "string"}},
+        [{"$set": {"session_id": {"$toObjectId": "$session_id"}}}],
+    )
+
+    print(f"✅ Migrated {result.modified_count} chat messages")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate_chat_message_session_ids())
@@ -3,6 +3,7 @@ Seed database with initial learning nodes and exercises
 """
 import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import DeleteMany, InsertOne
 from datetime import datetime
 
 # MongoDB connection
@@ -17,9 +18,8 @@ async def seed_database():
 
     print("🌱 Seeding database...")
 
-    # Clear existing data
-    await db.learning_nodes.delete_many({})
-    await db.exercises.delete_many({})
+    # One timestamp for every seeded document
+    now = datetime.utcnow()
 
     # Seed learning nodes
     nodes = [
@@ -47,8 +47,8 @@ async def seed_database():
                     "Building CLI tools"
                 ]
             },
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
+            "created_at": now,
+            "updated_at": now
         },
         {
             "node_id": "bash-scripting",
@@ -74,8 +74,8 @@ async def seed_database():
                     "System monitoring"
                 ]
             },
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
+            "created_at": now,
+            "updated_at": now
         },
         {
             "node_id": "terraform-basics",
@@ -101,14 +101,11 @@ async def seed_database():
                     "Infrastructure versioning"
                 ]
             },
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
+            "created_at": now,
+            "updated_at": now
         }
     ]
 
-    result = await db.learning_nodes.insert_many(nodes)
-    print(f"✅ Inserted {len(result.inserted_ids)} learning nodes")
-
     # Seed exercises
     exercises = [
         {
@@ -147,7 +144,7 @@ async def seed_database():
                 "style_weight": 0.1,
                 "efficiency_weight": 0.1
             },
-            "created_at": datetime.utcnow()
+            "created_at": now
         },
         {
             "exercise_id": "bash-echo",
@@ -180,16 +177,27 @@ async def seed_database():
                 "style_weight": 0.0,
                 "efficiency_weight": 0.0
             },
-            "created_at": datetime.utcnow()
+            "created_at": now
         }
     ]
 
-    result = await db.exercises.insert_many(exercises)
-    print(f"✅ Inserted {len(result.inserted_ids)} exercises")
+    # Clear existing data and insert the seed in one round trip per
+    # collection; ordered, so the delete runs before the inserts
+    node_result, exercise_result = await asyncio.gather(
+        db.learning_nodes.bulk_write(_replace_all(nodes), ordered=True),
+        db.exercises.bulk_write(_replace_all(exercises), ordered=True)
+    )
+    print(f"✅ Inserted {node_result.inserted_count} learning nodes")
+    print(f"✅ Inserted {exercise_result.inserted_count} exercises")
 
     print("🎉 Database seeded successfully!")
     client.close()
 
 
+def _replace_all(documents):
+    """Bulk operations that empty a collection and insert documents"""
+    return [DeleteMany({}), *(InsertOne(doc) for doc in documents)]
+
+
 if __name__ == "__main__":
     asyncio.run(seed_database())